@@ -1,17 +1,32 @@
 """EZID module"""
 
+import re
 import urllib
+import logging
 import xml.dom.minidom
+import xml.parsers.expat
 import copy
-import requests
+import collections
+import contextlib
+import threading
 from .exceptions import *
 from .metadata_classes import *
 from .xml_utils import *
+from . import connection
 
+# base_url and observers are read by every request, so set them before
+# DOI objects are shared between threads
 base_url = 'https://ezid.cdlib.org'
 
 test_prefix = '10.5072/FK2'
 
+# callables called as observer(identifier, landing_page, metadata) after
+# a DOI is minted or updated; errors raised by observers are logged and
+# not passed on, since the write has already been made
+observers = []
+
+logger = logging.getLogger(__name__)
+
 base_xml = """<?xml version="1.0"?>
 <resource xmlns="http://datacite.org/schema/kernel-3" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://datacite.org/schema/kernel-3 http://schema.datacite.org/meta/kernel-3/metadata.xsd">
   <identifier identifierType="DOI"/>
@@ -54,11 +69,43 @@ metadata_values = {'creators': MVCreators,
                    'descriptions': MVDescriptions, 
                    'geolocations': MVGeoLocations}
 
+# key -> element that holds the key's value
+container_tags = {'creators': 'creators', 
+                  'title': 'title', 
+                  'publisher': 'publisher', 
+                  'publicationyear': 'publicationYear', 
+                  'subjects': 'subjects', 
+                  'contributors': 'contributors', 
+                  'dates': 'dates', 
+                  'resourcetype': 'resourceType', 
+                  'alternateidentifiers': 'alternateIdentifiers', 
+                  'relatedidentifiers': 'relatedIdentifiers', 
+                  'sizes': 'sizes', 
+                  'formats': 'formats', 
+                  'version': 'version', 
+                  'rights': 'rightsList', 
+                  'descriptions': 'descriptions', 
+                  'geolocations': 'geoLocations'}
+
 class DOI:
 
-    def __init__(self, identifier):
+    """a DOI and its landing page and metadata
+
+    the record is loaded from EZID unless both landing_page and metadata
+    (which should be validated, as by validate_metadata()) are given
+
+    a DOI may be shared between threads: updates to the same identifier
+    are serialized, and concurrent loads of an identifier share one
+    request
+    """
+
+    def __init__(self, identifier, landing_page=None, metadata=None):
         self.identifier = identifier
-        self.load()
+        if landing_page is None or metadata is None:
+            self.load()
+        else:
+            self.landing_page = landing_page
+            self.metadata = metadata
         return
 
     @property
@@ -66,47 +113,19 @@ class DOI:
         return self.identifier.startswith(test_prefix)
 
     def record_exists(self):
-        """returns False if the dx.doi.org record redirects to:
-
-            http://datacite.org/invalidDOI
-            http://www.datacite.org/testprefix
-
-        returns True otherwise
-        """
-        url = 'http://dx.doi.org/%s' % self.identifier
-        r = requests.get(url, allow_redirects=False)
-        if r.status_code != 303:
-            return True
-        if 'Location' not in r.headers:
-            return True
-        if r.headers['Location'] == 'http://datacite.org/invalidDOI':
-            return False
-        if r.headers['Location'] == 'http://www.datacite.org/testprefix':
-            return False
-        return True
+        return record_exists(self.identifier)
 
     def load(self):
-        url = '%s/id/doi:%s' % (base_url, self.identifier)
-        r = requests.get(url)
-        if r.content.startswith('error:'):
-            if 'no such identifier' in r.content:
-                raise NotFoundError(self.identifier)
-            raise RequestError(r.content[6:].strip())
-        if not r.content.startswith('success:'):
-            raise RequestError('no success line in request response')
-        datacite = None
-        landing_page = None
-        for line in r.content.split('\n'):
-            if line.startswith('datacite: '):
-                datacite = urllib.unquote(line[10:])
-            if line.startswith('_target: '):
-                landing_page = line[9:]
-        if not datacite:
-            raise RequestError('no datacite field in request response')
-        if not landing_page:
-            raise RequestError('no landing page in request response')
-        self.metadata = xml_to_metadata(datacite)
-        self.landing_page = landing_page
+        with _using(self.identifier) as entry:
+            while True:
+                (generation, record) = _load_record(self.identifier, entry)
+                # a write that finished during the load may have set newer
+                # values than those loaded, so load again
+                with entry.lock:
+                    if entry.generation == generation:
+                        (self.landing_page, datacite) = record
+                        self.metadata = LazyMetadata(datacite)
+                        break
         return
 
     def copy_metadata(self):
@@ -114,31 +133,47 @@ class DOI:
 
     def update_metadata(self, metadata, auth):
         md2 = validate_metadata(metadata)
-        url = '%s/id/doi:%s' % (base_url, self.identifier)
-        headers = {'Content-Type': 'text/plain'}
-        body = _create_request_body(self.landing_page, 
-                                    self.identifier, 
-                                    md2)
-        r = requests.post(url, auth=auth, headers=headers, data=body)
-        if r.content.startswith('error:'):
-            raise RequestError(r.content[6:].strip())
-        if not r.content.startswith('success:'):
-            raise UpdateError('bad content returned from EZID')
-        self.metadata = md2
+        with _identifier_lock(self.identifier):
+            url = '%s/id/doi:%s' % (base_url, self.identifier)
+            headers = {'Content-Type': 'text/plain'}
+            body = _create_request_body(self.landing_page, 
+                                        self.identifier, 
+                                        md2)
+            r = connection.request('ezid', 
+                                   'update', 
+                                   'POST', 
+                                   url, 
+                                   auth=auth, 
+                                   headers=headers, 
+                                   data=body)
+            if r.content.startswith('error:'):
+                raise RequestError(r.content[6:].strip())
+            if not r.content.startswith('success:'):
+                raise UpdateError('bad content returned from EZID')
+            self.metadata = md2
+            _notify(self.identifier, self.landing_page, self.metadata)
         return
 
     def update_landing_page(self, landing_page, auth):
-        url = '%s/id/doi:%s' % (base_url, self.identifier)
-        headers = {'Content-Type': 'text/plain'}
-        body = _create_request_body(landing_page, 
-                                    self.identifier, 
-                                    self.metadata)
-        r = requests.post(url, auth=auth, headers=headers, data=body)
-        if r.content.startswith('error:'):
-            raise RequestError(r.content[6:].strip())
-        if not r.content.startswith('success:'):
-            raise UpdateError('bad content returned from EZID')
-        self.landing_page = landing_page
+        with _identifier_lock(self.identifier):
+            url = '%s/id/doi:%s' % (base_url, self.identifier)
+            headers = {'Content-Type': 'text/plain'}
+            body = _create_request_body(landing_page, 
+                                        self.identifier, 
+                                        self.metadata)
+            r = connection.request('ezid', 
+                                   'update', 
+                                   'POST', 
+                                   url, 
+                                   auth=auth, 
+                                   headers=headers, 
+                                   data=body)
+            if r.content.startswith('error:'):
+                raise RequestError(r.content[6:].strip())
+            if not r.content.startswith('success:'):
+                raise UpdateError('bad content returned from EZID')
+            self.landing_page = landing_page
+            _notify(self.identifier, self.landing_page, self.metadata)
         return
 
     @property
@@ -146,7 +181,7 @@ class DOI:
         return create_datacite_xml(self.identifier, self.metadata)
 
 def validate_metadata(metadata):
-    if not isinstance(metadata, dict):
+    if not isinstance(metadata, collections.Mapping):
         raise TypeError('metadata must be a dictionary')
     md2 = {}
     for (k, v) in metadata.iteritems():
@@ -158,12 +193,58 @@ def validate_metadata(metadata):
             raise ValueError('missing mandatory metadata key "%s"' % key)
     return md2
 
+def record_exists(identifier):
+    """returns False if the dx.doi.org record redirects to:
+
+        http://datacite.org/invalidDOI
+        http://www.datacite.org/testprefix
+
+    returns True otherwise
+    """
+    url = 'http://dx.doi.org/%s' % identifier
+    r = connection.request('resolver', 
+                           'exists', 
+                           'GET', 
+                           url, 
+                           allow_redirects=False)
+    if r.status_code != 303:
+        return True
+    if 'Location' not in r.headers:
+        return True
+    if r.headers['Location'] == 'http://datacite.org/invalidDOI':
+        return False
+    if r.headers['Location'] == 'http://www.datacite.org/testprefix':
+        return False
+    return True
+
 def mint(landing_page, metadata, doi_prefix, auth):
     md2 = validate_metadata(metadata)
+    return _mint(landing_page, md2, doi_prefix, auth)
+
+def mint_doi(landing_page, metadata, doi_prefix, auth):
+    """mint a DOI and return it as a DOI object without reloading it
+
+    its metadata is the validated metadata with empty values for the
+    keys not given, so it is the same as that of a DOI loaded from EZID
+    """
+    md2 = validate_metadata(metadata)
+    identifier = _mint(landing_page, md2, doi_prefix, auth)
+    return DOI(identifier, landing_page, _full_metadata(md2))
+
+def _mint(landing_page, md2, doi_prefix, auth):
+    """mint a DOI with validated metadata md2 and return its identifier"""
     url = '%s/shoulder/doi:%s' % (base_url, doi_prefix)
     headers = {'Content-Type': 'text/plain'}
-    body = _create_request_body(landing_page, None, md2)
-    r = requests.post(url, auth=auth, headers=headers, data=body)
+    datacite_xml = create_datacite_xml(None, md2)
+    body = '_target: %s\n' % landing_page
+    body += 'datacite: %s\n' % urllib.quote(datacite_xml)
+    r = connection.request('ezid', 
+                           'mint', 
+                           'POST', 
+                           url, 
+                           auth=auth, 
+                           headers=headers, 
+                           data=body)
     if r.content.startswith('error:'):
         raise RequestError(r.content[6:].strip())
     if not r.content.startswith('success:'):
@@ -175,8 +256,82 @@ def mint(landing_page, metadata, doi_prefix, auth):
             break
     else:
         raise MintError('no identifier returned from EZID')
+    _notify(identifier, landing_page, md2)
     return identifier
 
+def create(identifier, landing_page, metadata, auth):
+    """create a DOI with the given identifier"""
+    md2 = validate_metadata(metadata)
+    url = '%s/id/doi:%s' % (base_url, identifier)
+    headers = {'Content-Type': 'text/plain'}
+    body = _create_request_body(landing_page, identifier, md2)
+    with _identifier_lock(identifier):
+        r = connection.request('ezid', 
+                               'create', 
+                               'PUT', 
+                               url, 
+                               auth=auth, 
+                               headers=headers, 
+                               data=body)
+        if r.content.startswith('error:'):
+            if 'identifier already exists' in r.content:
+                raise ExistsError(identifier)
+            raise RequestError(r.content[6:].strip())
+        if not r.content.startswith('success:'):
+            raise MintError('bad content returned from EZID')
+        _notify(identifier, landing_page, md2)
+    return
+
+def update(identifier, auth, landing_page=None, metadata=None, record=None):
+    """send only the given fields of a DOI to EZID
+
+    observers are passed the DOI's full landing page and metadata after
+    the update.  record, if given, is that (landing_page, metadata);
+    otherwise, if there are observers, the fields not sent are read
+    back from EZID
+    """
+    url = '%s/id/doi:%s' % (base_url, identifier)
+    headers = {'Content-Type': 'text/plain'}
+    body = ''
+    if landing_page is not None:
+        body += '_target: %s\n' % landing_page
+    if metadata is not None:
+        metadata = validate_metadata(metadata)
+        datacite_xml = create_datacite_xml(identifier, metadata)
+        body += 'datacite: %s\n' % urllib.quote(datacite_xml)
+    with _identifier_lock(identifier):
+        r = connection.request('ezid', 
+                               'update', 
+                               'POST', 
+                               url, 
+                               auth=auth, 
+                               headers=headers, 
+                               data=body)
+        if r.content.startswith('error:'):
+            raise RequestError(r.content[6:].strip())
+        if not r.content.startswith('success:'):
+            raise UpdateError('bad content returned from EZID')
+        if not observers:
+            return
+        if record is None:
+            if landing_page is None or metadata is None:
+                try:
+                    (current_landing_page, 
+                     datacite) = _fetch_record(identifier)
+                except Exception:
+                    # the update was made; only the observers miss it
+                    logger.exception('reading back %s for observers '
+                                     'failed', 
+                                     identifier)
+                    return
+                if landing_page is None:
+                    landing_page = current_landing_page
+                if metadata is None:
+                    metadata = xml_to_metadata(datacite)
+            record = (landing_page, metadata)
+        _notify(identifier, record[0], record[1])
+    return
+
 def create_datacite_xml(identifier, metadata):
     """return the datacite XML representation"""
     doc = xml.dom.minidom.parseString(base_xml)
@@ -191,15 +346,292 @@ def create_datacite_xml(identifier, metadata):
 
 def xml_to_metadata(data):
     doc = xml.dom.minidom.parseString(data)
-    metadata = {}
-    for (key, cls) in metadata_values.iteritems():
-        metadata[key] = cls.extract_from_xml(doc)
+    metadata = _extract(doc, metadata_values)
+    # break the DOM's reference cycles so it is freed now rather than 
+    # left for the garbage collector
+    doc.unlink()
     return metadata
 
+def _extract(doc, keys):
+    """return a dictionary of the values for keys in a datacite DOM
+
+    DataCite leaves optional elements out of records; a missing element
+    gives the same value as an empty one
+    """
+    present = set( el.tagName for el in doc.getElementsByTagName('*') )
+    values = {}
+    for key in keys:
+        if container_tags[key] in present:
+            values[key] = metadata_values[key].extract_from_xml(doc)
+        else:
+            values[key] = copy.copy(_empty_values[key])
+    return values
+
+class LazyMetadata(collections.MutableMapping):
+
+    """metadata dictionary that decodes datacite XML on demand
+
+    behaves like the dictionary returned by xml_to_metadata(), but each
+    field is decoded only when it is first read, by parsing just its 
+    element (see _fragment()); no DOM is kept between reads
+
+    reads may come from several threads; decoding is done under a lock
+    """
+
+    def __init__(self, datacite):
+        self.datacite = datacite
+        self._keys = set(metadata_values)
+        self._values = {}
+        self._lock = threading.Lock()
+        return
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = _decode_field(self.datacite, key)
+            return self._values[key]
+
+    def __setitem__(self, key, value):
+        self._keys.add(key)
+        self._values[key] = value
+        return
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys.discard(key)
+        self._values.pop(key, None)
+        return
+
+    def __iter__(self):
+        for key in metadata_values:
+            if key in self._keys:
+                yield key
+        for key in self._keys:
+            if key not in metadata_values:
+                yield key
+        return
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __deepcopy__(self, memo):
+        # the copy shares the (immutable) XML and decodes it separately
+        md = LazyMetadata(self.datacite)
+        md._keys = set(self._keys)
+        with self._lock:
+            md._values = copy.deepcopy(self._values, memo)
+        return md
+
+    def __repr__(self):
+        return repr(dict(self))
+
+_root_re = re.compile(r'<[^?!]')
+
+def _fragment(datacite, tag):
+    """return the XML from the first tag element in datacite to the end
+    of the last, wrapped in the prolog and a copy of the root element, 
+    or '' if there is no tag element
+
+    raises ValueError if the text cannot be split this way
+    """
+    if '<!--' in datacite or '<![CDATA[' in datacite:
+        # the tags found might be in them
+        raise ValueError('comments or CDATA in datacite')
+    m = re.search(r'<%s[\s/>]' % tag, datacite)
+    if m is None:
+        return ''
+    start = m.start()
+    end_tag = '</%s>' % tag
+    close = datacite.rfind(end_tag)
+    if close > start:
+        end = close + len(end_tag)
+    else:
+        # a single empty element
+        end = datacite.find('>', start) + 1
+        if datacite[end-2:end] != '/>':
+            raise ValueError('no end tag for %s' % tag)
+    root = _root_re.search(datacite)
+    if root is None:
+        raise ValueError('no root element')
+    root_end = datacite.find('>', root.start()) + 1
+    if not 0 < root_end <= start:
+        raise ValueError('no root element')
+    root_tag = datacite[root.start()+1:root_end-1].split()[0]
+    # the prolog is kept for its encoding and entity declarations
+    return '%s%s</%s>' % (datacite[:root_end], datacite[start:end], root_tag)
+
+def _decode_field(datacite, key):
+    """return the value for key in datacite XML, parsing only the XML
+    for its element if it can be found by _fragment()"""
+    try:
+        fragment = _fragment(datacite, container_tags[key])
+        if not fragment:
+            return copy.copy(_empty_values[key])
+        doc = xml.dom.minidom.parseString(fragment)
+    except (ValueError, xml.parsers.expat.ExpatError):
+        doc = xml.dom.minidom.parseString(datacite)
+    try:
+        return _extract(doc, [key])[key]
+    finally:
+        doc.unlink()
+
+def _fetch_record(identifier):
+    """return (landing_page, datacite) for identifier from EZID"""
+    url = '%s/id/doi:%s' % (base_url, identifier)
+    r = connection.request('ezid', 'load', 'GET', url)
+    if r.content.startswith('error:'):
+        if 'no such identifier' in r.content:
+            raise NotFoundError(identifier)
+        raise RequestError(r.content[6:].strip())
+    if not r.content.startswith('success:'):
+        raise RequestError('no success line in request response')
+    datacite = None
+    landing_page = None
+    for line in r.content.split('\n'):
+        if line.startswith('datacite: '):
+            datacite = urllib.unquote(line[10:])
+        if line.startswith('_target: '):
+            landing_page = line[9:]
+    if not datacite:
+        raise RequestError('no datacite field in request response')
+    if not landing_page:
+        raise RequestError('no landing page in request response')
+    return (landing_page, datacite)
+
+class _Load:
+
+    """a load in progress, shared by concurrent callers"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        return
+
+class _Identifier:
+
+    """the state shared by the threads using an identifier"""
+
+    def __init__(self):
+        # serializes writes; reentrant so that observers may load the
+        # identifier being written
+        self.lock = threading.RLock()
+        self.users = 0
+        # the number of writes finished
+        self.generation = 0
+        # the _Load in progress, if it started after the last write
+        self.load = None
+        return
+
+# identifier -> _Identifier, while it is in use
+_identifiers = {}
+_identifiers_lock = threading.Lock()
+
+@contextlib.contextmanager
+def _using(identifier):
+    """yield the _Identifier for identifier, kept until the block ends"""
+    with _identifiers_lock:
+        entry = _identifiers.get(identifier)
+        if entry is None:
+            entry = _identifiers[identifier] = _Identifier()
+        entry.users += 1
+    try:
+        yield entry
+    finally:
+        with _identifiers_lock:
+            entry.users -= 1
+            if entry.users == 0:
+                del _identifiers[identifier]
+
+def _load_record(identifier, entry):
+    """return (generation, (landing_page, datacite)) for identifier,
+    where generation is entry's generation when the request started
+
+    concurrent loads of the same identifier share one request, unless
+    a write finished after it started
+    """
+    with _identifiers_lock:
+        generation = entry.generation
+        load = entry.load
+        leader = load is None
+        if leader:
+            load = entry.load = _Load()
+    if not leader:
+        load.done.wait()
+        if load.error is not None:
+            raise load.error
+        return (generation, load.result)
+    try:
+        load.result = _fetch_record(identifier)
+    except Exception as exc:
+        load.error = exc
+        raise
+    finally:
+        with _identifiers_lock:
+            if entry.load is load:
+                entry.load = None
+        load.done.set()
+    return (generation, load.result)
+
+@contextlib.contextmanager
+def _identifier_lock(identifier):
+    """serialize writes to identifier; writes to other identifiers are 
+    not blocked
+
+    once the write is finished, loads that started before it are no 
+    longer shared or used
+    """
+    with _using(identifier) as entry:
+        with entry.lock:
+            try:
+                yield
+            finally:
+                with _identifiers_lock:
+                    entry.generation += 1
+                    entry.load = None
+
+def _notify(identifier, landing_page, metadata):
+    for observer in observers:
+        try:
+            observer(identifier, landing_page, metadata)
+        except Exception:
+            logger.exception('observer %r failed for %s', 
+                             observer, 
+                             identifier)
+    return
+
 def _create_request_body(landing_page, identifier, metadata):
     datacite_xml = create_datacite_xml(identifier, metadata)
     body = '_target: %s\n' % landing_page
     body += 'datacite: %s\n' % urllib.quote(datacite_xml)
     return body
 
+def _extract_empty_values():
+    doc = xml.dom.minidom.parseString(base_xml)
+    values = {}
+    for (key, cls) in metadata_values.iteritems():
+        values[key] = cls.extract_from_xml(doc)
+    doc.unlink()
+    return values
+
+# key -> value extracted from an empty element
+_empty_values = _extract_empty_values()
+
+def _full_metadata(md2):
+    """return validated metadata md2 with empty values for missing keys,
+    as xml_to_metadata() would decode it"""
+    metadata = copy.deepcopy(_empty_values)
+    metadata.update(md2)
+    return metadata
+
 # eof
@@ -0,0 +1,153 @@
+"""command-line interface for bulk EZID operations
+
+    python -m ezid <command> [options] < input > output
+
+get, exists and export read identifiers (one per line) from stdin; mint
+and update read JSON records (one per line).  results are written to
+stdout as JSON records, one per line, as they complete, and a summary
+is written to stderr at the end.
+
+results are not in input order: mint and update results (and all
+errors) include the input line as "input", and mint and update results
+include the record's "key", if it has one.  update sends the fields
+given in one request.
+"""
+
+import sys
+import os
+import json
+import getpass
+import argparse
+import ezid
+from ezid import bulk
+from ezid import transport
+
+def _lines(f):
+    for line in iter(f.readline, ''):
+        line = line.strip()
+        if line:
+            yield line
+    return
+
+def _get(args, identifier):
+    doi = ezid.DOI(identifier)
+    return {'identifier': identifier,
+            'landing_page': doi.landing_page,
+            'metadata': dict(doi.metadata)}
+
+def _exists(args, identifier):
+    return {'identifier': identifier,
+            'exists': ezid.record_exists(identifier)}
+
+def _export(args, identifier):
+    doi = ezid.DOI(identifier)
+    return {'identifier': identifier,
+            'landing_page': doi.landing_page,
+            'xml': doi.xml}
+
+def _result(line, record, **fields):
+    # results come back in completion order, so each echoes its input
+    # line and the record's key, if it has one
+    result = {'input': line}
+    if 'key' in record:
+        result['key'] = record['key']
+    result.update(fields)
+    return result
+
+def _mint(args, line):
+    record = json.loads(line)
+    identifier = ezid.mint(record['landing_page'],
+                           record['metadata'],
+                           args.prefix,
+                           args.auth)
+    return _result(line, record, identifier=identifier)
+
+def _update(args, line):
+    record = json.loads(line)
+    landing_page = record.get('landing_page')
+    metadata = record.get('metadata')
+    updated = [ field for field in ('metadata', 'landing_page')
+                if record.get(field) is not None ]
+    if updated:
+        ezid.update(record['identifier'], args.auth, landing_page, metadata)
+    return _result(line,
+                   record,
+                   identifier=record['identifier'],
+                   updated=updated)
+
+# command -> (function, needs authentication)
+commands = {'get': (_get, False),
+            'exists': (_exists, False),
+            'export': (_export, False),
+            'mint': (_mint, True),
+            'update': (_update, True)}
+
+def _auth(args):
+    user = args.user or os.environ.get('EZID_USER')
+    if not user:
+        raise ValueError('no EZID user given (use --user or EZID_USER)')
+    password = os.environ.get('EZID_PASSWORD')
+    if password is None:
+        password = getpass.getpass('EZID password for %s: ' % user)
+    return (user, password)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m ezid',
+                                     description='bulk EZID operations')
+    parser.add_argument('command', choices=sorted(commands))
+    parser.add_argument('--concurrency', '-c', type=int, default=4,
+                        help='number of concurrent requests (default 4)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='adapt concurrency to EZID latency and errors, '
+                             'starting at --concurrency')
+    parser.add_argument('--max-concurrency', type=int, default=32,
+                        help='limit for --adaptive (default 32)')
+    parser.add_argument('--user', '-u',
+                        help='EZID user (default $EZID_USER); the password '
+                             'is taken from $EZID_PASSWORD or prompted for')
+    parser.add_argument('--prefix', default=ezid.test_prefix,
+                        help='DOI prefix (shoulder) for mint (default %s)' %
+                             ezid.test_prefix)
+    parser.add_argument('--base-url', default=ezid.base_url,
+                        help='EZID base URL (default %s)' % ezid.base_url)
+    parser.add_argument('--http2', action='store_true',
+                        help='multiplex requests over HTTP/2 '
+                             '(requires hyper)')
+    args = parser.parse_args(argv)
+    ezid.base_url = args.base_url
+    if args.http2:
+        ezid.connection.transport = transport.HTTP2Transport()
+    (func, needs_auth) = commands[args.command]
+    if needs_auth:
+        try:
+            args.auth = _auth(args)
+        except ValueError as exc:
+            parser.error(str(exc))
+    if args.adaptive:
+        try:
+            concurrency = bulk.AdaptiveLimiter(args.concurrency,
+                                               maximum=args.max_concurrency)
+        except ValueError as exc:
+            parser.error(str(exc))
+    else:
+        concurrency = args.concurrency
+    stats = bulk.Stats()
+    items = _lines(sys.stdin)
+    f = lambda item: func(args, item)
+    for (item, result, error) in bulk.run(f, items, concurrency, stats):
+        if error is not None:
+            result = {'input': item, 'error': str(error)}
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+    sys.stderr.write('%s: %s\n' % (args.command, stats.summary()))
+    if args.adaptive:
+        sys.stderr.write('%s: final concurrency %d\n' % (args.command,
+                                                          concurrency.limit))
+    if stats.errors:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# eof
@@ -0,0 +1,332 @@
+"""columnar container for validating and serializing many metadata records
+
+    batch = MetadataBatch.from_records(metadata_dicts)
+    batch.validate()
+    for body in batch.iter_request_bodies(landing_pages):
+        ...
+
+a batch holds one column per metadata_values key.  string fields are
+plain lists with None for missing values; list fields keep all records'
+elements in one flat list, with offsets[i]:offsets[i+1] the elements of
+record i.  validate() checks and normalizes each column in one pass (a
+single MV* instance per list column), and the XML is generated directly
+from the columns, so no per-record MV* instances or DOMs are built.
+"""
+
+import urllib
+import xml.dom.minidom
+import ezid
+
+_string_keys = ('title', 'publisher', 'publicationyear', 'resourcetype',
+                'version')
+
+class ListColumn:
+
+    """elements of a list field for all the records in a batch"""
+
+    def __init__(self):
+        self.values = []
+        self.offsets = [0]
+        # indexes of records without the field
+        self.missing = set()
+        return
+
+    def append(self, value):
+        if value is None:
+            self.missing.add(len(self.offsets) - 1)
+        else:
+            self.values.extend(value)
+        self.offsets.append(len(self.values))
+        return
+
+    def __getitem__(self, i):
+        if i in self.missing:
+            return None
+        return self.values[self.offsets[i]:self.offsets[i+1]]
+
+class MetadataBatch:
+
+    """a batch of metadata records stored by column"""
+
+    def __init__(self):
+        self.n = 0
+        self.columns = {}
+        for key in ezid.metadata_values:
+            if key in _string_keys:
+                self.columns[key] = []
+            else:
+                self.columns[key] = ListColumn()
+        self.validated = False
+        return
+
+    @classmethod
+    def from_records(cls, records):
+        batch = cls()
+        for metadata in records:
+            batch.append(metadata)
+        return batch
+
+    def __len__(self):
+        return self.n
+
+    def append(self, metadata):
+        """add a metadata dictionary to the batch"""
+        for key in metadata:
+            if key not in ezid.metadata_values:
+                msg = 'record %d: unknown metadata key "%s"' % (self.n, key)
+                raise ValueError(msg)
+        for (key, column) in self.columns.iteritems():
+            value = metadata.get(key)
+            if key in _string_keys:
+                column.append(value)
+                continue
+            if value is not None and not isinstance(value, (tuple, list)):
+                msg = 'record %d: %s must be a list or a tuple' % (self.n,
+                                                                   key)
+                raise ValueError(msg)
+            column.append(value)
+        self.n += 1
+        self.validated = False
+        return
+
+    def validate(self):
+        """check and normalize every column
+
+        the values are normalized as validate_metadata() would normalize
+        them; raises ValueError naming a bad record
+        """
+        for (key, cls) in ezid.metadata_values.iteritems():
+            column = self.columns[key]
+            if key in _string_keys:
+                self._validate_strings(key, cls, column)
+            else:
+                self._validate_list(key, cls, column)
+        self.validated = True
+        return
+
+    def _validate_strings(self, key, cls, column):
+        # the checks of cls's constructor, without an instance per record
+        for (i, value) in enumerate(column):
+            if value is None:
+                if cls.mandatory:
+                    msg = 'missing mandatory metadata key "%s"' % key
+                    raise ValueError('record %d: %s' % (i, msg))
+                continue
+            try:
+                cls.check(value)
+            except ValueError as exc:
+                raise ValueError('record %d: %s' % (i, exc))
+        return
+
+    def _validate_list(self, key, cls, column):
+        if cls.mandatory and column.missing:
+            i = min(column.missing)
+            msg = 'record %d: missing mandatory metadata key "%s"' % (i, key)
+            raise ValueError(msg)
+        try:
+            # one instance validates the elements of every record
+            column.values = cls(column.values).value
+        except ValueError:
+            # find the record at fault
+            for i in xrange(self.n):
+                value = column[i]
+                if value is None:
+                    continue
+                try:
+                    cls(value)
+                except ValueError as exc:
+                    raise ValueError('record %d: %s' % (i, exc))
+            raise
+        return
+
+    def record(self, i):
+        """return the metadata dictionary for record i"""
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError('record index out of range')
+        metadata = {}
+        for (key, column) in self.columns.iteritems():
+            value = column[i]
+            if value is not None:
+                metadata[key] = value
+        return metadata
+
+    def __iter__(self):
+        for i in xrange(self.n):
+            yield self.record(i)
+        return
+
+    def iter_xml(self, identifiers=None):
+        """yield the datacite XML for each record
+
+        identifiers, if given, is a sequence of identifiers for the
+        records (None for records to be minted); the output is the same
+        as create_datacite_xml()'s
+        """
+        if not self.validated:
+            self.validate()
+        for i in xrange(self.n):
+            if identifiers is None or identifiers[i] is None:
+                identifier = '(:tba)'
+            else:
+                identifier = 'doi:%s' % identifiers[i]
+            parts = []
+            for (literal, key) in _template:
+                parts.append(literal)
+                if key is None:
+                    continue
+                if key == 'identifier':
+                    parts.append(_element('identifier',
+                                          {'identifierType': 'DOI'},
+                                          identifier))
+                else:
+                    parts.append(_serializers[key](self.columns[key][i]))
+            yield u''.join(parts)
+        return
+
+    def iter_request_bodies(self, landing_pages, identifiers=None):
+        """yield the EZID request body for each record
+
+        landing_pages is a sequence of landing pages for the records;
+        see iter_xml() for identifiers
+        """
+        for (i, datacite_xml) in enumerate(self.iter_xml(identifiers)):
+            body = '_target: %s\n' % landing_pages[i]
+            datacite_xml = datacite_xml.encode('utf-8')
+            body += 'datacite: %s\n' % urllib.quote(datacite_xml)
+            yield body
+        return
+
+def _escape(value):
+    # as xml.dom.minidom escapes text and attribute values
+    value = value.replace('&', '&amp;')
+    value = value.replace('<', '&lt;')
+    value = value.replace('"', '&quot;')
+    value = value.replace('>', '&gt;')
+    return value
+
+def _element(tag, attributes, text, children=None):
+    s = u'<' + tag
+    # xml.dom.minidom writes attributes in sorted order; None values are
+    # left out
+    for name in sorted(attributes):
+        if attributes[name] is not None:
+            s += u' %s="%s"' % (name, _escape(attributes[name]))
+    if children is not None:
+        return s + u'>' + u''.join(children) + u'</%s>' % tag
+    if text is None:
+        return s + u'/>'
+    return s + u'>' + _escape(text) + u'</%s>' % tag
+
+def _container(tag, children):
+    if not children:
+        return u'<%s/>' % tag
+    return _element(tag, {}, None, children)
+
+def _creator(name, affiliation):
+    children = [_element('creatorName', {}, name)]
+    if affiliation is not None:
+        children.append(_element('affiliation', {}, affiliation))
+    return _element('creator', {}, None, children)
+
+def _contributor(type, name, affiliation):
+    children = [_element('contributorName', {}, name)]
+    if affiliation is not None:
+        children.append(_element('affiliation', {}, affiliation))
+    return _element('contributor', {'contributorType': type}, None, children)
+
+def _resource_type(value):
+    if value is None:
+        return u'<resourceType/>'
+    (general, type) = value.split('/', 1)
+    return _element('resourceType', {'resourceTypeGeneral': general}, type)
+
+def _list_serializer(tag, element):
+    # element takes the parts of a tuple element or a string element
+    def serialize(values):
+        children = []
+        for v in values or ():
+            if isinstance(v, tuple):
+                children.append(element(*v))
+            else:
+                children.append(element(v))
+        return _container(tag, children)
+    return serialize
+
+def _string_serializer(tag):
+    return lambda value: _element(tag, {}, value)
+
+_serializers = {
+    'creators': _list_serializer('creators', _creator),
+    'title': _string_serializer('title'),
+    'publisher': _string_serializer('publisher'),
+    'publicationyear': _string_serializer('publicationYear'),
+    'subjects': _list_serializer('subjects', lambda s, scheme, uri:
+        _element('subject',
+                 {'subjectScheme': scheme or None, 'schemeURI': uri or None},
+                 s)),
+    'contributors': _list_serializer('contributors', _contributor),
+    'dates': _list_serializer('dates', lambda type, date:
+        _element('date', {'dateType': type}, date)),
+    'resourcetype': _resource_type,
+    'alternateidentifiers': _list_serializer('alternateIdentifiers',
+        lambda type, identifier:
+        _element('alternateIdentifier',
+                 {'alternateIdentifierType': type},
+                 identifier)),
+    'relatedidentifiers': _list_serializer('relatedIdentifiers',
+        lambda identifier, identifier_type, relation_type:
+        _element('relatedIdentifier',
+                 {'relatedIdentifierType': identifier_type,
+                  'relationType': relation_type},
+                 identifier)),
+    'sizes': _list_serializer('sizes', lambda v: _element('size', {}, v)),
+    'formats': _list_serializer('formats',
+                                lambda v: _element('format', {}, v)),
+    'version': _string_serializer('version'),
+    'rights': _list_serializer('rightsList', lambda rights, uri:
+        _element('rights', {'rightsURI': uri or None}, rights)),
+    'descriptions': _list_serializer('descriptions', lambda type, d:
+        _element('description', {'descriptionType': type}, d)),
+    'geolocations': _list_serializer('geoLocations', lambda v:
+        _element('geoLocation',
+                 {},
+                 None,
+                 [_element('geoLocationPlace', {}, v)])),
+    }
+
+# (element in base_xml as serialized by minidom, metadata key)
+_slots = (('<identifier identifierType="DOI"/>', 'identifier'),
+          ('<creators/>', 'creators'),
+          ('<title/>', 'title'),
+          ('<publisher/>', 'publisher'),
+          ('<publicationYear/>', 'publicationyear'),
+          ('<subjects/>', 'subjects'),
+          ('<contributors/>', 'contributors'),
+          ('<dates/>', 'dates'),
+          ('<resourceType/>', 'resourcetype'),
+          ('<alternateIdentifiers/>', 'alternateidentifiers'),
+          ('<relatedIdentifiers/>', 'relatedidentifiers'),
+          ('<sizes/>', 'sizes'),
+          ('<formats/>', 'formats'),
+          ('<version/>', 'version'),
+          ('<rightsList/>', 'rights'),
+          ('<descriptions/>', 'descriptions'),
+          ('<geoLocations/>', 'geolocations'))
+
+def _make_template():
+    """split base_xml as create_datacite_xml() writes it into a list of
+    (literal text, key of the element that follows or None)"""
+    rest = xml.dom.minidom.parseString(ezid.base_xml).toxml()
+    template = []
+    for (element, key) in _slots:
+        (literal, sep, rest) = rest.partition(element)
+        assert sep
+        template.append((literal, key))
+    template.append((rest, None))
+    return template
+
+_template = _make_template()
+
+# eof
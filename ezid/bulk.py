@@ -0,0 +1,261 @@
+"""bulk operations: run a function over a stream of items in worker threads"""
+
+import threading
+import Queue
+import time
+import collections
+from .exceptions import *
+
+# errors caused by the request rather than by load on EZID; these do not
+# reduce an AdaptiveLimiter's limit
+client_errors = (ValueError,
+                 TypeError,
+                 KeyError,
+                 NotFoundError,
+                 ExistsError,
+                 PendingMintError)
+
+class Stats:
+
+    """counts and latencies for a bulk operation"""
+
+    def __init__(self):
+        self.start = time.time()
+        self.end = None
+        self.count = 0
+        self.errors = 0
+        self.latencies = []
+        return
+
+    def add(self, latency, error=False):
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.latencies.append(latency)
+        return
+
+    def finish(self):
+        self.end = time.time()
+        return
+
+    @property
+    def elapsed(self):
+        if self.end is None:
+            return time.time() - self.start
+        return self.end - self.start
+
+    @property
+    def throughput(self):
+        """completed items per second"""
+        if self.elapsed <= 0:
+            return 0.0
+        return self.count / self.elapsed
+
+    def percentile(self, p):
+        """return the latency at percentile p (0-100), or None"""
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        i = int(round((len(latencies) - 1) * p / 100.0))
+        return latencies[i]
+
+    def summary(self):
+        s = '%d items, %d errors in %.1f s (%.1f/s)' % (self.count,
+                                                        self.errors,
+                                                        self.elapsed,
+                                                        self.throughput)
+        if self.latencies:
+            mean = sum(self.latencies) / len(self.latencies)
+            s += '; latency mean %.3f p50 %.3f p95 %.3f max %.3f s' % \
+                 (mean,
+                  self.percentile(50),
+                  self.percentile(95),
+                  max(self.latencies))
+        return s
+
+class AdaptiveLimiter:
+
+    """adaptive limit on the number of requests in flight
+
+    the limit grows additively (by about increase per round trip's worth
+    of completions) while latency stays within tolerance times the
+    baseline (the smoothed minimum latency seen), and is cut
+    multiplicatively (by decrease) on errors that suggest overload
+    (see client_errors) or latency spikes, at most once per round trip
+
+    pass a limiter as the concurrency argument of run()
+    """
+
+    def __init__(self,
+                 initial=4,
+                 minimum=1,
+                 maximum=64,
+                 increase=1.0,
+                 decrease=0.5,
+                 tolerance=2.0,
+                 window=10):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError('need 1 <= minimum <= initial <= maximum')
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.window = window
+        self.cond = threading.Condition()
+        self._limit = float(initial)
+        self.in_flight = 0
+        self.baseline = None
+        self.last_decrease = 0
+        # completion times within the last window seconds
+        self.completions = collections.deque()
+        return
+
+    @property
+    def limit(self):
+        """the current limit on requests in flight"""
+        return int(self._limit)
+
+    @property
+    def throughput(self):
+        """completions per second over the last window seconds"""
+        with self.cond:
+            self._trim(time.time())
+            return len(self.completions) / float(self.window)
+
+    def _trim(self, now):
+        while self.completions and self.completions[0] < now - self.window:
+            self.completions.popleft()
+        return
+
+    def acquire(self):
+        """wait until another request may be made"""
+        with self.cond:
+            while self.in_flight >= int(self._limit):
+                self.cond.wait()
+            self.in_flight += 1
+        return
+
+    def release(self, latency, error=None, now=None):
+        """record the outcome of a request made after acquire()
+
+        now is the time the request completed (the current time by
+        default)
+        """
+        if now is None:
+            now = time.time()
+        with self.cond:
+            self.in_flight -= 1
+            self.completions.append(now)
+            self._trim(now)
+            overloaded = error is not None \
+                         and not isinstance(error, client_errors)
+            if error is None:
+                if self.baseline is None or latency < self.baseline:
+                    self.baseline = latency
+                else:
+                    # drift up slowly so the baseline follows real changes
+                    self.baseline = 0.99 * self.baseline + 0.01 * latency
+                if latency > self.tolerance * self.baseline:
+                    overloaded = True
+            if overloaded:
+                if now - self.last_decrease > latency:
+                    self._limit = max(self.minimum,
+                                      self._limit * self.decrease)
+                    self.last_decrease = now
+            elif error is None:
+                self._limit = min(self.maximum,
+                                  self._limit + self.increase / self._limit)
+            self.cond.notify_all()
+        return
+
+class _FeedError:
+
+    """wraps an exception raised while reading the items"""
+
+    def __init__(self, exc):
+        self.exc = exc
+        return
+
+_done = object()
+
+def run(func, items, concurrency=4, stats=None):
+    """apply func to each of items using concurrency worker threads
+
+    concurrency may also be an AdaptiveLimiter, in which case up to its
+    maximum worker threads are started and the limiter decides how many
+    calls are in flight
+
+    items is consumed lazily and may be an unbounded stream (such as
+    sys.stdin); at most a few items per worker are read ahead
+
+    yields (item, result, error) tuples in completion order; if func
+    raised an exception, error is the exception and result is None
+
+    if stats (a Stats instance) is given it is updated as items complete
+    """
+    if isinstance(concurrency, AdaptiveLimiter):
+        limiter = concurrency
+        concurrency = limiter.maximum
+    else:
+        limiter = None
+    if concurrency < 1:
+        raise ValueError('concurrency must be at least 1')
+    in_q = Queue.Queue(concurrency * 2)
+    out_q = Queue.Queue()
+    def feed():
+        try:
+            for item in items:
+                in_q.put(item)
+        except Exception as exc:
+            out_q.put(_FeedError(exc))
+        for i in xrange(concurrency):
+            in_q.put(_done)
+        return
+    def work():
+        while True:
+            item = in_q.get()
+            if item is _done:
+                out_q.put(_done)
+                return
+            if limiter is not None:
+                limiter.acquire()
+            t0 = time.time()
+            try:
+                result = func(item)
+                error = None
+            except Exception as exc:
+                result = None
+                error = exc
+            latency = time.time() - t0
+            if limiter is not None:
+                limiter.release(latency, error)
+            out_q.put((item, result, error, latency))
+        return
+    threads = [threading.Thread(target=feed)]
+    for i in xrange(concurrency):
+        threads.append(threading.Thread(target=work))
+    for t in threads:
+        t.daemon = True
+        t.start()
+    n_done = 0
+    feed_error = None
+    while n_done < concurrency:
+        value = out_q.get()
+        if value is _done:
+            n_done += 1
+            continue
+        if isinstance(value, _FeedError):
+            feed_error = value.exc
+            continue
+        (item, result, error, latency) = value
+        if stats is not None:
+            stats.add(latency, error is not None)
+        yield (item, result, error)
+    if stats is not None:
+        stats.finish()
+    if feed_error is not None:
+        raise feed_error
+    return
+
+# eof
@@ -0,0 +1,58 @@
+"""canonical forms and hashes of metadata
+
+two metadata dictionaries that describe the same record -- for instance
+one given to mint() and the one xml_to_metadata() returns for the
+minted record -- have the same canonical form and so the same hashes
+"""
+
+import json
+import hashlib
+import ezid
+
+def canonical_metadata(metadata):
+    """return the canonical form of a metadata dictionary
+
+    the metadata is validated, empty values (which xml_to_metadata()
+    returns for absent elements) are dropped and tuples become lists
+    """
+    md = {}
+    for (key, value) in metadata.items():
+        if not value:
+            continue
+        # xml_to_metadata() returns this for an empty resourceType
+        if key == 'resourcetype' and value == '/':
+            continue
+        md[key] = value
+    return canonical_value(ezid.validate_metadata(md))
+
+def canonical_value(value):
+    if isinstance(value, (tuple, list)):
+        return [ canonical_value(v) for v in value ]
+    if isinstance(value, dict):
+        return dict( (k, canonical_value(v)) for (k, v) in value.items() )
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return value
+
+def value_hash(value):
+    """return a hash of a value in canonical form"""
+    data = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(data).hexdigest()
+
+def record_hash(landing_page, metadata):
+    """return a hash of a landing page and metadata"""
+    md = canonical_metadata(metadata)
+    return value_hash({'_target': canonical_value(landing_page),
+                       'metadata': md})
+
+def field_hashes(landing_page, metadata):
+    """return a dictionary of hashes of each metadata field
+
+    the landing page hash is under the key "_target"
+    """
+    md = canonical_metadata(metadata)
+    hashes = dict( (key, value_hash(value)) for (key, value) in md.items() )
+    hashes['_target'] = value_hash(canonical_value(landing_page))
+    return hashes
+
+# eof
@@ -0,0 +1,362 @@
+"""HTTP requests to EZID and the DOI resolver
+
+every request is made for an endpoint ("ezid" or "resolver") and an
+operation (a key of timeouts).  the operation sets the connect and read
+timeouts and the overall deadline for the call; the endpoint's circuit
+breaker fails calls fast while the endpoint is failing.  the requests
+themselves are made by transport (see ezid.transport).
+
+a call with a deadline runs in a thread of its own, and is abandoned
+(its response closed) when the deadline passes, however slowly the
+server answers; until then KeyboardInterrupt waits for the call.
+timeouts while reading a body raise RequestTimeoutError, as timeouts
+waiting for the response do.
+"""
+
+import sys
+import time
+import heapq
+import atexit
+import socket
+import threading
+import requests
+from requests.packages.urllib3.exceptions import ReadTimeoutError
+from .exceptions import *
+from .transport import RequestsTransport
+
+transport = RequestsTransport()
+
+# operation -> (connect timeout, read timeout) in seconds
+timeouts = {'load': (3.05, 30),
+            'update': (3.05, 60),
+            'mint': (3.05, 60),
+            'create': (3.05, 60),
+            'exists': (3.05, 10),
+            'download_request': (3.05, 60),
+            'download': (3.05, 300)}
+
+# operation -> overall deadline for the call in seconds (None for none)
+deadlines = {'load': 60,
+             'update': 120,
+             'mint': 120,
+             'create': 120,
+             'exists': 20,
+             'download_request': 120,
+             'download': None}
+
+class CircuitBreaker:
+
+    """fails calls fast after repeated failures
+
+    after failure_threshold consecutive failures the breaker opens and
+    calls raise CircuitOpenError.  after reset_timeout seconds it is
+    half-open: one call is let through as a probe, and its outcome
+    closes the breaker again or reopens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+        return
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened is None:
+                return 'closed'
+            if self.probing \
+               or time.time() - self.opened >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def before(self):
+        """call before a request; raises CircuitOpenError if it may not
+        be made"""
+        with self.lock:
+            if self.opened is None:
+                return
+            if self.probing \
+               or time.time() - self.opened < self.reset_timeout:
+                raise CircuitOpenError(self.name)
+            self.probing = True
+        return
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.probing = False
+        return
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened = time.time()
+            self.probing = False
+        return
+
+    def reset(self):
+        self.success()
+        return
+
+breakers = {'ezid': CircuitBreaker('ezid'),
+            'resolver': CircuitBreaker('resolver')}
+
+def _is_timeout(exc):
+    """return True if exc, raised by a transport or while reading a
+    response body, is a timeout"""
+    if isinstance(exc, (requests.exceptions.Timeout, socket.timeout)):
+        return True
+    # requests reports read timeouts in the body as connection errors
+    if isinstance(exc, requests.exceptions.ConnectionError) and exc.args:
+        return isinstance(exc.args[0], (ReadTimeoutError, socket.timeout))
+    return False
+
+class Response:
+
+    """an HTTP response
+
+    content holds the body unless the request was streamed, in which
+    case the body is read with iter_content() and close() must be called
+    """
+
+    def __init__(self, status_code, headers, content=None, raw=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.raw = raw
+        return
+
+    def iter_content(self, chunk_size):
+        try:
+            for chunk in self.raw.iter_content(chunk_size):
+                yield chunk
+        except Exception as exc:
+            if _is_timeout(exc):
+                raise RequestTimeoutError('reading response timed out: %s' % \
+                                          exc)
+            raise
+        return
+
+    def close(self):
+        if self.raw is not None:
+            self.raw.close()
+        return
+
+class _Call:
+
+    """makes a request with send() and reads its body unless it is
+    streamed
+
+    run() makes the call in the calling thread.  start() makes it in a
+    thread of its own, and wait() waits for it to finish or to be
+    given up by expire(), which closes the response so that the thread
+    stops reading
+    """
+
+    def __init__(self, send, stream):
+        self.send = send
+        self.stream = stream
+        self.response = None
+        self.content = None
+        self.exc_info = None
+        self.lock = threading.Lock()
+        self.settled = threading.Event()
+        self.finished = False
+        self.expired = False
+        return
+
+    def run(self):
+        try:
+            r = self.send()
+            with self.lock:
+                self.response = r
+                expired = self.expired
+            if not self.stream and not expired:
+                self.content = ''.join(r.iter_content(64 * 1024))
+        except BaseException:
+            self.exc_info = sys.exc_info()
+        with self.lock:
+            self.finished = True
+            expired = self.expired
+            self.settled.set()
+        if expired and self.response is not None:
+            self.response.close()
+        return
+
+    def start(self):
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+        return
+
+    def expire(self):
+        with self.lock:
+            if self.finished:
+                return
+            self.expired = True
+            response = self.response
+            self.settled.set()
+        if response is not None:
+            response.close()
+        return
+
+    def wait(self):
+        """return True if the call finished, False if it expired"""
+        # an untimed wait: timed waits poll in Python 2
+        self.settled.wait()
+        return not self.expired
+
+    def release(self):
+        """drop the references the watchdog would otherwise keep"""
+        self.send = None
+        self.response = None
+        self.content = None
+        self.exc_info = None
+        return
+
+class _Watchdog:
+
+    """expires calls that pass their deadlines, from a thread of its
+    own"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        # heap of (deadline, sequence number, call); settled calls are
+        # left in it until it is compacted
+        self.calls = []
+        self.seq = 0
+        # the number of calls added and not yet discarded
+        self.live = 0
+        self.thread = None
+        self.stopping = False
+        return
+
+    def add(self, deadline, call):
+        with self.cond:
+            self.seq += 1
+            self.live += 1
+            heapq.heappush(self.calls, (deadline, self.seq, call))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+                atexit.register(self.stop)
+            if self.calls[0][2] is call:
+                # the thread is waiting for a later deadline, or none
+                self.cond.notify()
+        return
+
+    def discard(self, call):
+        """call once call has settled"""
+        with self.cond:
+            self.live -= 1
+            if len(self.calls) > 2 * self.live + 64:
+                self.calls = [ entry for entry in self.calls
+                               if not entry[2].settled.is_set() ]
+                heapq.heapify(self.calls)
+        return
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+        self.thread.join(1)
+        return
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.calls and not self.stopping:
+                    self.cond.wait()
+                if self.stopping:
+                    break
+                (deadline, seq, call) = self.calls[0]
+                remaining = deadline - time.time()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                    continue
+                heapq.heappop(self.calls)
+            call.expire()
+        return
+
+_watchdog = _Watchdog()
+
+def request(endpoint,
+            operation,
+            method,
+            url,
+            timeout=None,
+            deadline=None,
+            stream=False,
+            headers=None,
+            data=None,
+            auth=None,
+            allow_redirects=True):
+    """make an HTTP request and return a Response
+
+    timeout and deadline override the defaults for the operation; the
+    deadline does not apply to reading the body of a streamed response
+
+    raises CircuitOpenError if the endpoint is failing and
+    RequestTimeoutError if the request times out or passes its deadline
+    """
+    breaker = breakers[endpoint]
+    if timeout is None:
+        timeout = timeouts[operation]
+    if deadline is None:
+        deadline = deadlines[operation]
+    (connect_timeout, read_timeout) = timeout
+    if deadline is not None:
+        read_timeout = min(read_timeout, deadline)
+    def send():
+        return transport.request(method,
+                                 url,
+                                 headers=headers,
+                                 data=data,
+                                 auth=auth,
+                                 timeout=(connect_timeout, read_timeout),
+                                 allow_redirects=allow_redirects)
+    breaker.before()
+    failed = True
+    try:
+        call = _Call(send, stream)
+        if deadline is None:
+            call.run()
+        else:
+            call.start()
+            _watchdog.add(time.time() + deadline, call)
+            finished = call.wait()
+            _watchdog.discard(call)
+            if not finished:
+                msg = '%s exceeded its deadline of %s seconds' % \
+                      (operation, deadline)
+                raise RequestTimeoutError(msg)
+        (r, content, exc_info) = (call.response, call.content, call.exc_info)
+        call.release()
+        if exc_info is not None:
+            (exc_type, exc, tb) = exc_info
+            if _is_timeout(exc):
+                raise RequestTimeoutError('%s %s timed out: %s' % (method,
+                                                                   url,
+                                                                   exc))
+            raise exc_type, exc, tb
+        failed = r.status_code >= 500
+    finally:
+        # a probe that ends any way but with an answer (even
+        # KeyboardInterrupt) reopens the breaker
+        if failed:
+            breaker.failure()
+        else:
+            breaker.success()
+    if stream:
+        return Response(r.status_code, r.headers, raw=r)
+    return Response(r.status_code, r.headers, content)
+
+# eof
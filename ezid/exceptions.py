@@ -43,6 +43,13 @@ class ExistsError(EZIDError):
 
     """DOI already exists"""
 
+    def __init__(self, identifier):
+        self.identifier = identifier
+        return
+
+    def __str__(self):
+        return 'DOI %s already exists' % self.identifier
+
 class NotFoundError(EZIDError):
 
     """DOI does not exist"""
@@ -54,4 +61,37 @@ class NotFoundError(EZIDError):
     def __str__(self):
         return 'DOI %s not found' % self.identifier
 
+class PendingMintError(EZIDError):
+
+    """an earlier attempt to mint the same record has an unknown outcome"""
+
+    def __init__(self, key):
+        self.key = key
+        return
+
+    def __str__(self):
+        return 'mint of record %s is pending with unknown outcome' % self.key
+
+class RequestTimeoutError(EZIDError):
+
+    """request timed out or exceeded its deadline"""
+
+    def __init__(self, message):
+        self.message = message
+        return
+
+    def __str__(self):
+        return self.message
+
+class CircuitOpenError(EZIDError):
+
+    """request not sent because the endpoint's circuit breaker is open"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        return
+
+    def __str__(self):
+        return 'circuit breaker for %s is open' % self.endpoint
+
 # eof
@@ -0,0 +1,178 @@
+"""bulk harvest of an account's identifiers via EZID's batch download API
+
+    harvester = Harvester(auth, updated_after=last_run)
+    for (identifier, landing_page, metadata) in harvester.harvest(path):
+        ...
+
+the download is requested, fetched to path once EZID has prepared it,
+and then decompressed and parsed as a stream, so the whole dump is
+never held in memory
+"""
+
+import time
+import datetime
+import gzip
+import urllib
+import xml.parsers.expat
+import ezid
+from . import connection
+
+class Harvester:
+
+    """requests, fetches and parses EZID batch downloads
+
+    updated_after, if given, restricts the download to identifiers
+    updated since that time (a datetime in UTC, seconds since the epoch,
+    or an ISO 8601 string)
+
+    base_url defaults to ezid.base_url
+
+    records whose datacite XML cannot be parsed are skipped by harvest()
+    and listed in errors as (identifier, message)
+    """
+
+    def __init__(self,
+                 auth,
+                 updated_after=None,
+                 base_url=None,
+                 poll_interval=10,
+                 max_wait=3600):
+        self.auth = auth
+        self.updated_after = updated_after
+        self.base_url = base_url
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.errors = []
+        return
+
+    def request_download(self):
+        """request a download and return the URL it will be available at"""
+        base_url = self.base_url or ezid.base_url
+        url = '%s/download_request' % base_url
+        params = {'format': 'anvl', 'compression': 'gzip', 'type': 'doi'}
+        if self.updated_after is not None:
+            params['updatedAfter'] = _format_time(self.updated_after)
+        r = connection.request('ezid',
+                               'download_request',
+                               'POST',
+                               url,
+                               auth=self.auth,
+                               data=params)
+        if r.content.startswith('error:'):
+            raise ezid.RequestError(r.content[6:].strip())
+        if not r.content.startswith('success:'):
+            raise ezid.RequestError('no success line in request response')
+        return r.content[8:].strip()
+
+    def fetch(self, url, path):
+        """wait until the download at url is ready and save it to path
+
+        EZID returns 404 until the download has been prepared
+        """
+        t0 = time.time()
+        while True:
+            r = connection.request('ezid',
+                                   'download',
+                                   'GET',
+                                   url,
+                                   stream=True)
+            if r.status_code == 200:
+                break
+            r.close()
+            if r.status_code != 404:
+                msg = 'unexpected status %d fetching download' % r.status_code
+                raise ezid.RequestError(msg)
+            if time.time() - t0 > self.max_wait:
+                msg = 'download not ready after %d seconds' % self.max_wait
+                raise ezid.RequestError(msg)
+            time.sleep(self.poll_interval)
+        try:
+            with open(path, 'wb') as fo:
+                for chunk in r.iter_content(64 * 1024):
+                    fo.write(chunk)
+        finally:
+            r.close()
+        return
+
+    def harvest(self, path):
+        """request and fetch a download to path and parse it
+
+        returns an iterator over (identifier, landing_page, metadata)
+        """
+        self.fetch(self.request_download(), path)
+        return iter_dump(path, self._error)
+
+    def _error(self, identifier, exc):
+        self.errors.append((identifier, str(exc)))
+        return
+
+def iter_dump(path, on_error=None):
+    """parse a gzipped ANVL download
+
+    yields (identifier, landing_page, metadata) for each DOI in the
+    download; metadata is as returned by xml_to_metadata(), or None if
+    the record has no datacite XML
+
+    if on_error is given, records whose datacite XML cannot be parsed
+    are skipped and on_error(identifier, exception) is called for each;
+    otherwise the exception is raised
+    """
+    f = gzip.open(path, 'rb')
+    try:
+        for (identifier, fields) in iter_anvl(f):
+            if not identifier.startswith('doi:'):
+                continue
+            if 'datacite' in fields:
+                try:
+                    metadata = ezid.xml_to_metadata(fields['datacite'])
+                except (xml.parsers.expat.ExpatError,
+                        ValueError,
+                        AssertionError) as exc:
+                    if on_error is None:
+                        raise
+                    on_error(identifier[4:], exc)
+                    continue
+            else:
+                metadata = None
+            yield (identifier[4:], fields.get('_target'), metadata)
+    finally:
+        f.close()
+    return
+
+def iter_anvl(f):
+    """parse a stream of ANVL records from the file object f
+
+    records are separated by blank lines and begin with ":: identifier";
+    element values are percent-decoded
+
+    yields (identifier, fields) for each record
+    """
+    identifier = None
+    fields = {}
+    for line in f:
+        line = line.rstrip('\r\n')
+        if not line:
+            if identifier is not None:
+                yield (identifier, fields)
+            identifier = None
+            fields = {}
+            continue
+        if line.startswith('::'):
+            identifier = line[2:].strip()
+            continue
+        (name, sep, value) = line.partition(':')
+        if not sep:
+            raise ValueError('bad ANVL line "%s"' % line)
+        fields[urllib.unquote(name.strip())] = urllib.unquote(value.strip())
+    if identifier is not None:
+        yield (identifier, fields)
+    return
+
+def _format_time(t):
+    if isinstance(t, datetime.datetime):
+        return t.strftime('%Y-%m-%dT%H:%M:%SZ')
+    if isinstance(t, (int, long, float)):
+        return str(int(t))
+    return t
+
+# eof
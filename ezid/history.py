@@ -0,0 +1,188 @@
+"""local version history of DOI metadata
+
+    history = HistoryStore('history.db')
+    ezid.observers.append(history.observe)
+    (landing_page, metadata, t) = history.get(identifier, version=3)
+    for (identifier, version, t, changes) in history.changes_since(t0):
+        ...
+
+each version is stored as a field-level delta (the fields set and the
+fields removed) against the previous version, in the canonical form of
+ezid.canonical; every snapshot_interval versions the full state is also
+stored, so reconstructing any version applies at most that many deltas.
+the landing page is tracked as the field "_target".
+"""
+
+import time
+import json
+import threading
+import sqlite3
+import ezid
+from .canonical import canonical_metadata, canonical_value
+
+_schema = """
+CREATE TABLE IF NOT EXISTS versions (identifier TEXT NOT NULL,
+                                     version INTEGER NOT NULL,
+                                     time REAL NOT NULL,
+                                     delta TEXT NOT NULL,
+                                     PRIMARY KEY (identifier, version));
+CREATE INDEX IF NOT EXISTS versions_time ON versions (time);
+CREATE TABLE IF NOT EXISTS snapshots (identifier TEXT NOT NULL,
+                                      version INTEGER NOT NULL,
+                                      state TEXT NOT NULL,
+                                      PRIMARY KEY (identifier, version));
+"""
+
+def _state(landing_page, metadata):
+    state = canonical_metadata(metadata)
+    state['_target'] = canonical_value(landing_page)
+    return state
+
+def _delta(old, new):
+    delta = {'set': {}, 'unset': []}
+    for (key, value) in new.iteritems():
+        if old.get(key) != value:
+            delta['set'][key] = value
+    for key in old:
+        if key not in new:
+            delta['unset'].append(key)
+    return delta
+
+def _apply(state, delta):
+    state.update(delta['set'])
+    for key in delta['unset']:
+        del state[key]
+    return
+
+class HistoryStore:
+
+    """metadata history in the SQLite database path
+
+    may be shared between threads
+    """
+
+    def __init__(self, path, snapshot_interval=10):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(_schema)
+        self.lock = threading.Lock()
+        return
+
+    def close(self):
+        self.db.close()
+        return
+
+    def _latest_version(self, identifier):
+        query = 'SELECT MAX(version) FROM versions WHERE identifier = ?'
+        return self.db.execute(query, (identifier, )).fetchone()[0]
+
+    def _reconstruct(self, identifier, version):
+        query = 'SELECT version, state FROM snapshots ' + \
+                'WHERE identifier = ? AND version <= ? ' + \
+                'ORDER BY version DESC LIMIT 1'
+        row = self.db.execute(query, (identifier, version)).fetchone()
+        if row is None:
+            (base, state) = (0, {})
+        else:
+            (base, state) = (row[0], json.loads(row[1]))
+        query = 'SELECT delta FROM versions ' + \
+                'WHERE identifier = ? AND version > ? AND version <= ? ' + \
+                'ORDER BY version'
+        for (delta, ) in self.db.execute(query, (identifier, base, version)):
+            _apply(state, json.loads(delta))
+        return state
+
+    def record(self, identifier, landing_page, metadata, timestamp=None):
+        """record a version of identifier
+
+        returns the new version number, or None if nothing changed
+        """
+        new = _state(landing_page, metadata)
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            latest = self._latest_version(identifier)
+            if latest is None:
+                (version, old) = (1, {})
+            else:
+                version = latest + 1
+                old = self._reconstruct(identifier, latest)
+            delta = _delta(old, new)
+            if not delta['set'] and not delta['unset']:
+                return None
+            with self.db:
+                self.db.execute('INSERT INTO versions VALUES (?, ?, ?, ?)',
+                                (identifier,
+                                 version,
+                                 timestamp,
+                                 json.dumps(delta)))
+                if version % self.snapshot_interval == 0:
+                    self.db.execute('INSERT INTO snapshots VALUES (?, ?, ?)',
+                                    (identifier, version, json.dumps(new)))
+        return version
+
+    def observe(self, identifier, landing_page, metadata):
+        """observer for ezid.observers: records each saved version"""
+        self.record(identifier, landing_page, metadata)
+        return
+
+    def versions(self, identifier):
+        """return a list of (version, time) for identifier"""
+        query = 'SELECT version, time FROM versions WHERE identifier = ? ' + \
+                'ORDER BY version'
+        with self.lock:
+            return self.db.execute(query, (identifier, )).fetchall()
+
+    def get(self, identifier, version=None):
+        """return (landing_page, metadata, time) for a version of
+        identifier (the latest by default)
+
+        raises KeyError if there is no such version
+        """
+        with self.lock:
+            if version is None:
+                version = self._latest_version(identifier)
+            query = 'SELECT time FROM versions ' + \
+                    'WHERE identifier = ? AND version = ?'
+            row = self.db.execute(query, (identifier, version)).fetchone()
+            if row is None:
+                raise KeyError((identifier, version))
+            state = self._reconstruct(identifier, version)
+        landing_page = state.pop('_target', None)
+        return (landing_page, ezid.validate_metadata(state), row[0])
+
+    def changes_since(self, timestamp, page_size=1000):
+        """scan the versions recorded after timestamp, oldest first
+
+        yields (identifier, version, time, changes), where changes maps
+        each changed field to its new value, or to None if it was
+        removed
+
+        versions are read page_size at a time, and the store is not
+        locked between pages, so versions may be recorded during a scan
+        """
+        columns = 'SELECT identifier, version, time, delta FROM versions '
+        order = 'ORDER BY time, identifier, version LIMIT ?'
+        query = columns + 'WHERE time > ? ' + order
+        params = (timestamp, page_size)
+        while True:
+            with self.lock:
+                rows = self.db.execute(query, params).fetchall()
+            for (identifier, version, t, delta) in rows:
+                delta = json.loads(delta)
+                changes = delta['set']
+                for key in delta['unset']:
+                    changes[key] = None
+                yield (identifier, version, t, changes)
+            if len(rows) < page_size:
+                break
+            # the next page starts after the last row of this one
+            (identifier, version, t, delta) = rows[-1]
+            query = columns + \
+                    'WHERE time >= ? AND (time > ? OR identifier > ? OR ' + \
+                    '(identifier = ? AND version > ?)) ' + order
+            params = (t, t, identifier, identifier, version, page_size)
+        return
+
+# eof
@@ -0,0 +1,176 @@
+"""idempotent minting
+
+    minter = IdempotentMinter('mints.db', doi_prefix, auth)
+    identifier = minter.mint(landing_page, metadata)
+
+each mint is keyed by the canonical hash of its landing page and
+metadata (see ezid.canonical) and recorded as pending in a local
+SQLite store before it is sent to EZID.  minting the same record again
+returns the identifier already minted for it.
+
+if a mint fails without a reply from EZID (a timeout, for instance) it
+is not known whether EZID created the DOI, so the record stays pending
+and further attempts raise PendingMintError.  resolve() settles pending
+records against a harvest of the account (see ezid.harvest);
+clear_pending() discards them so they can be minted again.
+"""
+
+import time
+import threading
+import sqlite3
+import ezid
+from .canonical import record_hash
+
+_schema = """
+CREATE TABLE IF NOT EXISTS mints (key TEXT PRIMARY KEY,
+                                  identifier TEXT,
+                                  created REAL NOT NULL);
+"""
+
+class IdempotentMinter:
+
+    """mints through a local store at path
+
+    may be shared between threads, and the store between processes;
+    timeout is how long to wait for another process's lock on the store
+    """
+
+    def __init__(self, path, doi_prefix, auth, timeout=30):
+        self.db = sqlite3.connect(path,
+                                  timeout=timeout,
+                                  check_same_thread=False)
+        self.db.executescript(_schema)
+        self.doi_prefix = doi_prefix
+        self.auth = auth
+        self.cond = threading.Condition()
+        # keys being minted by this process
+        self.in_flight = set()
+        return
+
+    def close(self):
+        self.db.close()
+        return
+
+    def _get(self, key):
+        query = 'SELECT identifier, created FROM mints WHERE key = ?'
+        return self.db.execute(query, (key, )).fetchone()
+
+    def lookup(self, landing_page, metadata):
+        """return the identifier minted for a record, or None"""
+        key = record_hash(landing_page, metadata)
+        with self.cond:
+            row = self._get(key)
+        if row is None:
+            return None
+        return row[0]
+
+    def mint(self, landing_page, metadata):
+        """mint a DOI unless one has already been minted for this record
+
+        returns the identifier; raises PendingMintError if an earlier
+        attempt has an unknown outcome
+        """
+        md2 = ezid.validate_metadata(metadata)
+        return self._mint(landing_page, md2)
+
+    def _mint(self, landing_page, md2):
+        key = record_hash(landing_page, md2)
+        with self.cond:
+            while key in self.in_flight:
+                self.cond.wait()
+            while True:
+                row = self._get(key)
+                if row is not None:
+                    if row[0] is None:
+                        raise ezid.PendingMintError(key)
+                    return row[0]
+                # another process sharing the store may record the key
+                # between _get() and the insert
+                with self.db:
+                    query = 'INSERT OR IGNORE INTO mints VALUES (?, NULL, ?)'
+                    cursor = self.db.execute(query, (key, time.time()))
+                if cursor.rowcount == 1:
+                    break
+            self.in_flight.add(key)
+        identifier = None
+        try:
+            identifier = ezid.mint(landing_page,
+                                   md2,
+                                   self.doi_prefix,
+                                   self.auth)
+        except (ezid.RequestError, ezid.CircuitOpenError):
+            # the request was refused or never sent, so nothing was minted
+            with self.cond:
+                with self.db:
+                    self.db.execute('DELETE FROM mints WHERE key = ?',
+                                    (key, ))
+            raise
+        finally:
+            with self.cond:
+                if identifier is not None:
+                    with self.db:
+                        query = 'UPDATE mints SET identifier = ? WHERE key = ?'
+                        self.db.execute(query, (identifier, key))
+                self.in_flight.discard(key)
+                self.cond.notify_all()
+        return identifier
+
+    def mint_doi(self, landing_page, metadata):
+        """as mint(), but return a DOI object (see ezid.mint_doi())"""
+        md2 = ezid.validate_metadata(metadata)
+        identifier = self._mint(landing_page, md2)
+        return ezid.DOI(identifier, landing_page, ezid._full_metadata(md2))
+
+    def pending(self):
+        """return a list of (key, created) for pending mints"""
+        query = 'SELECT key, created FROM mints WHERE identifier IS NULL'
+        with self.cond:
+            return self.db.execute(query).fetchall()
+
+    def resolve(self, records):
+        """settle pending mints against existing records
+
+        records is an iterable of (identifier, landing_page, metadata),
+        such as Harvester(auth, updated_after=t).harvest(path) with t
+        no later than the oldest pending mint
+
+        returns the number of pending mints resolved
+        """
+        pending = set( key for (key, created) in self.pending() )
+        n = 0
+        for (identifier, landing_page, metadata) in records:
+            if not pending:
+                break
+            if metadata is None:
+                continue
+            try:
+                key = record_hash(landing_page, metadata)
+            except ValueError:
+                continue
+            if key not in pending:
+                continue
+            with self.cond:
+                with self.db:
+                    query = 'UPDATE mints SET identifier = ? WHERE key = ?'
+                    self.db.execute(query, (identifier, key))
+            pending.discard(key)
+            n += 1
+        return n
+
+    def clear_pending(self, key=None):
+        """forget pending mints (all of them if key is None)
+
+        only do this once it is known that EZID did not create the DOIs
+        """
+        with self.cond:
+            with self.db:
+                if key is None:
+                    query = 'DELETE FROM mints WHERE identifier IS NULL'
+                    self.db.execute(query)
+                else:
+                    query = 'DELETE FROM mints WHERE key = ? ' + \
+                            'AND identifier IS NULL'
+                    self.db.execute(query, (key, ))
+        return
+
+# eof
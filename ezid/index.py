@@ -0,0 +1,183 @@
+"""local persistent index of metadata for duplicate detection
+
+    index = MetadataIndex('index.db')
+    index.add_many(harvester.harvest(path))
+    ezid.observers.append(index.observe)
+    for (identifier, score) in index.duplicates(metadata):
+        ...
+
+records are indexed by normalized title, creator names, alternate
+identifiers and related identifiers; a query scores each indexed
+record by the weights of the terms it shares with the given metadata
+"""
+
+import re
+import unicodedata
+import threading
+import sqlite3
+
+# term kind -> weight
+weights = {'title': 2,
+           'creator': 1,
+           'alternateidentifier': 4,
+           'relatedidentifier': 1}
+
+_schema = """
+CREATE TABLE IF NOT EXISTS terms (term TEXT NOT NULL,
+                                  kind TEXT NOT NULL,
+                                  identifier TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS terms_term ON terms (term);
+CREATE INDEX IF NOT EXISTS terms_identifier ON terms (identifier);
+"""
+
+def normalize(value):
+    """normalize a string for comparison
+
+    accents and punctuation are removed, case is folded and whitespace
+    is collapsed
+    """
+    if not isinstance(value, unicode):
+        value = value.decode('utf-8')
+    value = unicodedata.normalize('NFKD', value)
+    value = u''.join(c for c in value if not unicodedata.combining(c))
+    value = re.sub(r'[\W_]+', ' ', value.lower(), flags=re.UNICODE)
+    return value.strip()
+
+def _normalize_name(name):
+    # "Smith, John" and "John Smith" index the same
+    return u' '.join(sorted(normalize(name).split()))
+
+def metadata_terms(metadata):
+    """return the set of (kind, term) pairs for a metadata dictionary"""
+    terms = set()
+    if metadata.get('title'):
+        terms.add(('title', normalize(metadata['title'])))
+    for creator in metadata.get('creators', ()):
+        if not isinstance(creator, basestring):
+            creator = creator[0]
+        terms.add(('creator', _normalize_name(creator)))
+    for (type, identifier) in metadata.get('alternateidentifiers', ()):
+        term = u'%s %s' % (normalize(type), identifier.strip().lower())
+        terms.add(('alternateidentifier', term))
+    for v in metadata.get('relatedidentifiers', ()):
+        terms.add(('relatedidentifier', v[0].strip().lower()))
+    terms.discard(('title', u''))
+    terms.discard(('creator', u''))
+    return terms
+
+class MetadataIndex:
+
+    """index of metadata dictionaries stored in the SQLite database path
+
+    the index may be shared between threads
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(_schema)
+        self.lock = threading.Lock()
+        return
+
+    def close(self):
+        self.db.close()
+        return
+
+    def __len__(self):
+        with self.lock:
+            query = 'SELECT COUNT(DISTINCT identifier) FROM terms'
+            return self.db.execute(query).fetchone()[0]
+
+    def _add(self, identifier, metadata):
+        self.db.execute('DELETE FROM terms WHERE identifier = ?',
+                        (identifier, ))
+        rows = [ (term, kind, identifier)
+                 for (kind, term) in metadata_terms(metadata) ]
+        self.db.executemany('INSERT INTO terms VALUES (?, ?, ?)', rows)
+        return
+
+    def add(self, identifier, metadata):
+        """add or replace the entry for identifier"""
+        with self.lock:
+            with self.db:
+                self._add(identifier, metadata)
+        return
+
+    def add_many(self, records):
+        """add or replace entries from (identifier, landing_page, metadata)
+
+        records is an iterable such as the one returned by
+        Harvester.harvest(); records without metadata are skipped
+        """
+        with self.lock:
+            with self.db:
+                for (identifier, landing_page, metadata) in records:
+                    if metadata is not None:
+                        self._add(identifier, metadata)
+        return
+
+    def remove(self, identifier):
+        with self.lock:
+            with self.db:
+                self.db.execute('DELETE FROM terms WHERE identifier = ?',
+                                (identifier, ))
+        return
+
+    def observe(self, identifier, landing_page, metadata):
+        """observer for ezid.observers: keeps the index up to date"""
+        self.add(identifier, metadata)
+        return
+
+    def _postings(self, term, limit):
+        """return the number of entries for term, counting no further
+        than limit"""
+        query = 'SELECT COUNT(*) FROM ' + \
+                '(SELECT 1 FROM terms WHERE term = ? LIMIT ?)'
+        return self.db.execute(query, (term, limit)).fetchone()[0]
+
+    def duplicates(self,
+                   metadata,
+                   min_score=3,
+                   exclude=None,
+                   max_postings=1000):
+        """find likely duplicates of metadata
+
+        returns a list of (identifier, score) for indexed records scoring
+        at least min_score, highest score first; exclude is an
+        identifier to leave out (e.g. the record being checked)
+
+        candidates are the records sharing a term found in at most
+        max_postings records; terms more common than that (a shared
+        collection DOI, say) add to candidates' scores but do not make
+        records candidates
+        """
+        terms = sorted(metadata_terms(metadata))
+        if not terms:
+            return []
+        score = 'SUM(CASE kind %s END)' % \
+                ' '.join( "WHEN '%s' THEN %d" % (kind, weight)
+                          for (kind, weight) in sorted(weights.items()) )
+        with self.lock:
+            limit = max_postings + 1
+            rare = [ (kind, term) for (kind, term) in terms
+                     if self._postings(term, limit) <= max_postings ]
+            if not rare:
+                return []
+            # "+term" keeps SQLite from scanning the postings of common
+            # terms; the candidates' rows are found by identifier
+            query = 'SELECT identifier, %s AS score FROM terms ' % score + \
+                    'WHERE (%s) ' % _term_clause('+term', terms) + \
+                    'AND identifier IN (SELECT identifier FROM terms ' + \
+                    'WHERE %s) ' % _term_clause('term', rare) + \
+                    'AND identifier IS NOT ? ' + \
+                    'GROUP BY identifier HAVING score >= ? ' + \
+                    'ORDER BY score DESC, identifier'
+            params = []
+            for (kind, term) in terms + rare:
+                params.extend((term, kind))
+            params.extend((exclude, min_score))
+            return self.db.execute(query, params).fetchall()
+
+def _term_clause(column, terms):
+    return ' OR '.join( '(%s = ? AND kind = ?)' % column for t in terms )
+
+# eof
@@ -0,0 +1,157 @@
+"""in-process stand-in for EZID and the DOI resolver
+
+    local_ezid = LocalEZID()
+    ezid.connection.transport = LocalTransport(local_ezid)
+
+LocalEZID answers the EZID API calls this package makes (get, create,
+mint on a shoulder, modify and batch download) and resolver lookups,
+keeping identifiers in memory.  it accepts any credentials.
+"""
+
+import time
+import calendar
+import threading
+import urllib
+import urlparse
+import gzip
+import StringIO
+
+class LocalEZID:
+
+    """handler for LocalTransport
+
+    latency, if given, is slept (in seconds) before each reply
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        # identifier -> (landing page, datacite XML, time updated)
+        self.records = {}
+        self.downloads = {}
+        self.n_minted = 0
+        return
+
+    def __call__(self, method, url, headers, data, auth):
+        if self.latency:
+            time.sleep(self.latency)
+        parts = urlparse.urlsplit(url)
+        path = urllib.unquote(parts.path)
+        if parts.netloc == 'dx.doi.org':
+            return self._resolve(path[1:])
+        if path.startswith('/id/doi:'):
+            identifier = path[8:]
+            if method == 'GET':
+                return self._get(identifier)
+            if auth is None:
+                return _reply(401, 'error: unauthorized')
+            if method == 'PUT':
+                return self._create(identifier, _parse_body(data))
+            if method == 'POST':
+                return self._modify(identifier, _parse_body(data))
+        if path.startswith('/shoulder/doi:') and method == 'POST':
+            if auth is None:
+                return _reply(401, 'error: unauthorized')
+            return self._mint(path[14:], _parse_body(data))
+        if path == '/download_request' and method == 'POST':
+            return self._download_request(url, data)
+        if path.startswith('/download/') and method == 'GET':
+            return self._download(path[10:])
+        return _reply(404, 'error: not found')
+
+    def _resolve(self, identifier):
+        with self.lock:
+            record = self.records.get(identifier)
+        if record is None:
+            return (303, {'Location': 'http://datacite.org/invalidDOI'}, '')
+        return (302, {'Location': record[0]}, '')
+
+    def _get(self, identifier):
+        with self.lock:
+            record = self.records.get(identifier)
+        if record is None:
+            return _reply(400, 'error: bad request - no such identifier')
+        body = 'success: doi:%s\n' % identifier
+        body += '_target: %s\n' % record[0]
+        body += 'datacite: %s\n' % urllib.quote(record[1])
+        return _reply(200, body)
+
+    def _create(self, identifier, fields):
+        with self.lock:
+            if identifier in self.records:
+                msg = 'error: bad request - identifier already exists'
+                return _reply(400, msg)
+            self.records[identifier] = (fields.get('_target', ''),
+                                        fields.get('datacite', ''),
+                                        time.time())
+        return _reply(201, 'success: doi:%s' % identifier)
+
+    def _mint(self, shoulder, fields):
+        with self.lock:
+            self.n_minted += 1
+            identifier = '%s%d' % (shoulder, self.n_minted)
+        datacite = fields.get('datacite', '')
+        datacite = datacite.replace('(:tba)', 'doi:%s' % identifier, 1)
+        fields['datacite'] = datacite
+        return self._create(identifier, fields)
+
+    def _modify(self, identifier, fields):
+        with self.lock:
+            record = self.records.get(identifier)
+            if record is None:
+                return _reply(400, 'error: bad request - no such identifier')
+            self.records[identifier] = (fields.get('_target', record[0]),
+                                        fields.get('datacite', record[1]),
+                                        time.time())
+        return _reply(200, 'success: doi:%s' % identifier)
+
+    def _download_request(self, url, params):
+        updated_after = params.get('updatedAfter')
+        if updated_after is not None:
+            updated_after = _parse_time(updated_after)
+        buf = StringIO.StringIO()
+        f = gzip.GzipFile(fileobj=buf, mode='wb')
+        with self.lock:
+            records = sorted(self.records.iteritems())
+        for (identifier, (target, datacite, updated)) in records:
+            if updated_after is not None and updated < updated_after:
+                continue
+            f.write(':: doi:%s\n' % identifier)
+            f.write('_target: %s\n' % urllib.quote(target))
+            f.write('datacite: %s\n\n' % urllib.quote(datacite))
+        f.close()
+        with self.lock:
+            name = '%d.anvl.gz' % len(self.downloads)
+            self.downloads[name] = buf.getvalue()
+        parts = urlparse.urlsplit(url)
+        download_url = '%s://%s/download/%s' % (parts.scheme,
+                                                parts.netloc,
+                                                name)
+        return _reply(200, 'success: %s' % download_url)
+
+    def _download(self, name):
+        with self.lock:
+            data = self.downloads.get(name)
+        if data is None:
+            return _reply(404, 'not found')
+        return (200, {'Content-Type': 'application/gzip'}, data)
+
+def _reply(status_code, body):
+    return (status_code, {'Content-Type': 'text/plain; charset=UTF-8'}, body)
+
+def _parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        t = time.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
+        return calendar.timegm(t)
+
+def _parse_body(data):
+    fields = {}
+    for line in data.split('\n'):
+        (name, sep, value) = line.partition(':')
+        if sep:
+            fields[urllib.unquote(name.strip())] = urllib.unquote(value.strip())
+    return fields
+
+# eof
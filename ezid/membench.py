@@ -0,0 +1,437 @@
+"""memory benchmarks for large load, parse, serialize and export jobs
+
+    python -m ezid.membench --records 100000
+    python -m ezid.membench --records 1000000 --benchmark harvest \
+                            --budget harvest=100:10
+
+each benchmark runs a job over n synthetic records held by a LocalEZID
+(see ezid.local):
+
+    load       load every DOI; the DOI objects are kept
+    listing    load every DOI and read its title and creators; the DOI
+               objects are kept
+    parse      xml_to_metadata() every record's XML; the dictionaries
+               are kept
+    serialize  build and validate a MetadataBatch of the records and
+               generate their request bodies; the batch is kept
+    export     load every DOI and generate its XML; nothing is kept
+    harvest    fetch a batch download and parse it with iter_dump();
+               nothing is kept
+
+only memory allocated while the job runs is counted (the corpus itself
+is not).  the peak is the most memory in use at once during the job;
+the steady state is what is still in use, after garbage collection,
+once the job has finished with its results still referenced.  both are
+reported in bytes per record and checked against budgets, so changes
+in the representation of records, or things kept that should not be,
+show up as budget failures.
+
+memory is measured with tracemalloc where it is available.  otherwise
+(Python 2.7) the heap is walked instead, totalling sys.getsizeof() over
+every live object, about ten times during each job; this is slower and
+misses memory not held in Python objects.  the default budgets are
+about 25% above the figures from the heap tracer with the default
+10000 records on Python 2.7.
+"""
+
+import sys
+import gc
+import time
+import random
+import tempfile
+import os
+import argparse
+import ezid
+from . import connection
+from .batch import MetadataBatch
+from .harvest import Harvester, iter_dump
+from .local import LocalEZID
+from .transport import LocalTransport
+
+# benchmark -> (peak bytes per record, steady-state bytes per record)
+budgets = {'load': (5000, 5000),
+           'listing': (13000, 13000),
+           'parse': (7500, 7500),
+           'serialize': (3000, 3000),
+           'export': (2000, 100),
+           'harvest': (2000, 100)}
+
+_words = ('brain', 'imaging', 'cortex', 'signal', 'model', 'analysis',
+          'volume', 'subject', 'session', 'scan', 'atlas', 'network',
+          'response', 'region', 'surface', 'pipeline', 'cohort', 'study')
+
+def _text(rng, min_words, max_words):
+    n = rng.randint(min_words, max_words)
+    return ' '.join(rng.choice(_words) for i in xrange(n))
+
+def synthetic_metadata(i):
+    """return the metadata dictionary for synthetic record i
+
+    the sizes of the records vary, but record i is always the same
+    """
+    rng = random.Random(i)
+    creators = []
+    for j in xrange(rng.randint(1, 5)):
+        creators.append(('Creator %d-%d' % (i, j),
+                         'Institution %d' % rng.randint(1, 100)))
+    metadata = {'creators': creators,
+                'title': 'Dataset %d: %s' % (i, _text(rng, 3, 12)),
+                'publisher': 'Publisher %d' % rng.randint(1, 20),
+                'publicationyear': str(rng.randint(1990, 2016)),
+                'resourcetype': rng.choice(('Dataset/Imaging',
+                                            'Text/Report',
+                                            'Software/Pipeline')),
+                'subjects': [(w, None, None) for w in
+                             rng.sample(_words, rng.randint(0, 4))],
+                'dates': [('Created', '%d-01-01' % rng.randint(1990, 2016))],
+                'descriptions': [('Abstract', _text(rng, 10, 80))],
+                'formats': ['application/x-gzip'],
+                'version': str(rng.randint(1, 9))}
+    if rng.random() < 0.5:
+        metadata['relatedidentifiers'] = [('10.5072/REL%d' % i,
+                                           'DOI',
+                                           'IsDerivedFrom')]
+    return metadata
+
+def populate(local_ezid, n, chunk_size=10000):
+    """add n synthetic records to local_ezid
+
+    returns the list of their identifiers
+    """
+    identifiers = []
+    for start in xrange(0, n, chunk_size):
+        stop = min(n, start + chunk_size)
+        chunk = ['%sMB%d' % (ezid.test_prefix, i)
+                 for i in xrange(start, stop)]
+        batch = MetadataBatch.from_records(synthetic_metadata(i)
+                                           for i in xrange(start, stop))
+        now = time.time()
+        for (identifier, xml) in zip(chunk, batch.iter_xml(chunk)):
+            landing_page = 'http://example.org/%s' % identifier
+            local_ezid.records[identifier] = (landing_page,
+                                              xml.encode('utf-8'),
+                                              now)
+        identifiers.extend(chunk)
+    return identifiers
+
+class Result:
+
+    """the memory used by a benchmark run"""
+
+    def __init__(self, name, n, peak, steady, elapsed, tracer):
+        self.name = name
+        self.n = n
+        self.peak = peak
+        self.steady = steady
+        self.elapsed = elapsed
+        self.tracer = tracer
+        return
+
+    @property
+    def peak_per_record(self):
+        return float(self.peak) / self.n
+
+    @property
+    def steady_per_record(self):
+        return float(self.steady) / self.n
+
+    def check(self, budget):
+        """return a list of the ways the result exceeds budget, a
+        (peak, steady-state) pair of bytes per record"""
+        (peak, steady) = budget
+        failures = []
+        if peak is not None and self.peak_per_record > peak:
+            failures.append('%s: peak %.0f bytes/record exceeds budget %d' %
+                            (self.name, self.peak_per_record, peak))
+        if steady is not None and self.steady_per_record > steady:
+            msg = '%s: steady state %.0f bytes/record exceeds budget %d' % \
+                  (self.name, self.steady_per_record, steady)
+            failures.append(msg)
+        return failures
+
+    def summary(self):
+        return '%s: %d records in %.1f s (%s), ' % (self.name,
+                                                    self.n,
+                                                    self.elapsed,
+                                                    self.tracer) + \
+               'peak %d bytes (%.0f/record), ' % (self.peak,
+                                                  self.peak_per_record) + \
+               'steady %d bytes (%.0f/record)' % (self.steady,
+                                                  self.steady_per_record)
+
+class Corpus:
+
+    """n synthetic records in a LocalEZID, installed as the transport
+    while the benchmarks run"""
+
+    auth = ('membench', 'membench')
+
+    def __init__(self, n):
+        self.n = n
+        self.local_ezid = LocalEZID()
+        self.identifiers = populate(self.local_ezid, n)
+        return
+
+    def __enter__(self):
+        self.saved = (connection.transport, ezid.base_url)
+        connection.transport = LocalTransport(self.local_ezid)
+        ezid.base_url = 'https://ezid.cdlib.org'
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        (connection.transport, ezid.base_url) = self.saved
+        return False
+
+    def record(self, identifier):
+        return self.local_ezid.records[identifier]
+
+def _load(corpus, sample):
+    dois = []
+    for identifier in corpus.identifiers:
+        dois.append(ezid.DOI(identifier))
+        sample()
+    return dois
+
+def _listing(corpus, sample):
+    dois = []
+    for identifier in corpus.identifiers:
+        doi = ezid.DOI(identifier)
+        (doi.metadata['title'], doi.metadata['creators'])
+        dois.append(doi)
+        sample()
+    return dois
+
+def _parse(corpus, sample):
+    metadata = []
+    for identifier in corpus.identifiers:
+        metadata.append(ezid.xml_to_metadata(corpus.record(identifier)[1]))
+        sample()
+    return metadata
+
+def _serialize(corpus, sample):
+    batch = MetadataBatch.from_records(synthetic_metadata(i)
+                                       for i in xrange(corpus.n))
+    sample()
+    landing_pages = corpus.landing_pages
+    for body in batch.iter_request_bodies(landing_pages, corpus.identifiers):
+        sample()
+    return batch
+
+def _serialize_setup(corpus):
+    corpus.landing_pages = [corpus.record(identifier)[0]
+                            for identifier in corpus.identifiers]
+    return
+
+def _export(corpus, sample):
+    for identifier in corpus.identifiers:
+        ezid.DOI(identifier).xml
+        sample()
+    return None
+
+def _harvest_setup(corpus):
+    # EZID prepares the download, so that is not part of the job
+    corpus.harvester = Harvester(corpus.auth, poll_interval=0)
+    corpus.download_url = corpus.harvester.request_download()
+    return
+
+def _harvest(corpus, sample):
+    (fd, path) = tempfile.mkstemp(suffix='.anvl.gz')
+    os.close(fd)
+    try:
+        corpus.harvester.fetch(corpus.download_url, path)
+        for record in iter_dump(path):
+            sample()
+    finally:
+        os.unlink(path)
+    return None
+
+# name -> (setup, job); jobs are called as job(corpus, sample), and call
+# sample() after each record.  the job's return value is kept while the
+# steady state is measured
+benchmarks = {'load': (None, _load),
+              'listing': (None, _listing),
+              'parse': (None, _parse),
+              'serialize': (_serialize_setup, _serialize),
+              'export': (None, _export),
+              'harvest': (_harvest_setup, _harvest)}
+
+class _TracemallocTracer:
+
+    """measures memory with tracemalloc"""
+
+    name = 'tracemalloc'
+
+    def __init__(self, tracemalloc):
+        self.tracemalloc = tracemalloc
+        return
+
+    def start(self):
+        self.tracemalloc.start()
+        return
+
+    def sample(self):
+        return
+
+    def get_traced_memory(self):
+        return self.tracemalloc.get_traced_memory()
+
+    def stop(self):
+        self.tracemalloc.stop()
+        return
+
+class _HeapTracer:
+
+    """measures memory by walking the heap, for Pythons without
+    tracemalloc
+
+    the memory in use is the total sys.getsizeof() of the objects the
+    garbage collector tracks and of everything they refer to.  memory
+    not held in Python objects is missed, and the peak is the largest
+    of the samples taken every interval calls to sample()
+    """
+
+    name = 'heap'
+
+    def __init__(self, interval):
+        self.interval = interval
+        return
+
+    def start(self):
+        self.calls = 0
+        self.peak = 0
+        self.base = 0
+        self.base = _heap_size()
+        return
+
+    def sample(self):
+        self.calls += 1
+        if self.calls % self.interval == 0:
+            self._measure()
+        return
+
+    def _measure(self):
+        current = _heap_size() - self.base
+        self.peak = max(self.peak, current)
+        return current
+
+    def get_traced_memory(self):
+        current = self._measure()
+        return (current, self.peak)
+
+    def stop(self):
+        return
+
+def _heap_size():
+    """return the total size of the objects reachable from those the
+    garbage collector tracks"""
+    stack = gc.get_objects()
+    # the walk's own containers are not counted
+    seen = set([id(stack)])
+    seen.add(id(seen))
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+def _tracer(n):
+    """return a tracemalloc tracer if tracemalloc is available, otherwise
+    a heap tracer sampling about ten times over n records"""
+    try:
+        import tracemalloc
+    except ImportError:
+        return _HeapTracer(max(1, n // 10))
+    return _TracemallocTracer(tracemalloc)
+
+def measure(corpus, name):
+    """run benchmark name over corpus and return a Result"""
+    tracer = _tracer(corpus.n)
+    (setup, job) = benchmarks[name]
+    with corpus:
+        if setup is not None:
+            setup(corpus)
+        gc.collect()
+        t0 = time.time()
+        tracer.start()
+        try:
+            kept = job(corpus, tracer.sample)
+            elapsed = time.time() - t0
+            gc.collect()
+            (steady, peak) = tracer.get_traced_memory()
+        finally:
+            tracer.stop()
+        del kept
+    return Result(name, corpus.n, peak, steady, elapsed, tracer.name)
+
+def run(n, names=None):
+    """run the benchmarks in names (all of them by default) over n
+    synthetic records
+
+    returns a list of Results
+    """
+    if names is None:
+        names = sorted(benchmarks)
+    for name in names:
+        if name not in benchmarks:
+            raise ValueError('unknown benchmark "%s"' % name)
+    corpus = Corpus(n)
+    return [measure(corpus, name) for name in names]
+
+def check(results, budgets=budgets):
+    """return a list of the budgets results exceed"""
+    failures = []
+    for result in results:
+        if result.name in budgets:
+            failures.extend(result.check(budgets[result.name]))
+    return failures
+
+def _parse_budget(value):
+    """parse NAME=PEAK[:STEADY] (bytes per record; an empty value is not
+    checked)"""
+    (name, sep, limits) = value.partition('=')
+    if not sep or name not in benchmarks:
+        raise argparse.ArgumentTypeError('bad budget "%s"' % value)
+    (peak, sep, steady) = limits.partition(':')
+    try:
+        peak = int(peak) if peak else None
+        steady = int(steady) if steady else None
+    except ValueError:
+        raise argparse.ArgumentTypeError('bad budget "%s"' % value)
+    return (name, (peak, steady))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m ezid.membench',
+                                     description='EZID memory benchmarks')
+    parser.add_argument('--records', '-n', type=int, default=10000,
+                        help='number of synthetic records (default 10000)')
+    parser.add_argument('--benchmark', '-b', action='append',
+                        choices=sorted(benchmarks),
+                        help='benchmark to run (may be repeated; default '
+                             'all)')
+    parser.add_argument('--budget', action='append', type=_parse_budget,
+                        default=[],
+                        help='NAME=PEAK[:STEADY] budget in bytes per record '
+                             '(may be repeated; overrides the default)')
+    args = parser.parse_args(argv)
+    if args.records < 1:
+        parser.error('--records must be at least 1')
+    limits = dict(budgets)
+    limits.update(args.budget)
+    results = run(args.records, args.benchmark)
+    for result in results:
+        sys.stdout.write(result.summary() + '\n')
+    failures = check(results, limits)
+    for failure in failures:
+        sys.stderr.write(failure + '\n')
+    if failures:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+# eof
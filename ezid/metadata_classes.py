@@ -3,6 +3,9 @@ import re
 from .controlled_values import *
 from .xml_utils import xml_text, xml_add_text
 
+_year_re = re.compile('^[0-9]{4}$')
+_resourcetypegeneral_set = frozenset(resourcetypegeneral_values)
+
 class MetadataValue:
 
     """base class for metadata values
@@ -15,9 +18,15 @@ class MetadataValue:
 class MVStringBase(MetadataValue):
 
     def __init__(self, value):
+        self.check(value)
+        self.value = value
+        return
+
+    @classmethod
+    def check(cls, value):
+        """raise ValueError if value is not valid"""
         if not isinstance(value, basestring):
             raise ValueError('value must be a basestring')
-        self.value = value
         return
 
     def update_xml(self, doc):
@@ -141,12 +150,12 @@ class MVPublicationYear(MVStringBase):
     mandatory = True
     xml_tag = 'publicationYear'
 
-    def __init__(self, value):
+    @classmethod
+    def check(cls, value):
         if not isinstance(value, basestring):
             raise ValueError('publicationyear must be a basestring')
-        if not re.search('^[0-9]{4}$', value):
+        if not _year_re.search(value):
             raise ValueError('publicationyear must be a four-digit number')
-        self.value = value
         return
 
 class MVSubjects(MetadataValue):
@@ -185,7 +194,7 @@ class MVSubjects(MetadataValue):
                     raise ValueError(seq_err)
                 if not isinstance(subject, basestring):
                     raise ValueError(seq_err)
-                if not isinstance(scheme, basestring):
+                if not isinstance(scheme, (types.NoneType, basestring)):
                     raise ValueError(seq_err)
                 if not isinstance(uri, (types.NoneType, basestring)):
                     raise ValueError(seq_err)
@@ -199,12 +208,13 @@ class MVSubjects(MetadataValue):
         assert len(elements) == 1
         subjects_el = elements[0]
         for (subject, scheme, uri) in self.value:
-            el = doc.createElement('subjet')
+            el = doc.createElement('subject')
             if scheme:
                 el.setAttribute('subjectScheme', scheme)
             if uri:
                 el.setAttribute('schemeURI', uri)
             el.appendChild(doc.createTextNode(subject))
+            subjects_el.appendChild(el)
         return
 
     @classmethod
@@ -216,8 +226,12 @@ class MVSubjects(MetadataValue):
             subject = xml_text(el)
             if el.hasAttribute('subjectScheme'):
                 scheme = el.getAttribute('subjectScheme')
-            if el.hasAttribute('subjectURI'):
-                uri = el.getAttribute('subjectURI')
+            else:
+                scheme = None
+            if el.hasAttribute('schemeURI'):
+                uri = el.getAttribute('schemeURI')
+            else:
+                uri = None
             value.append((subject, scheme, uri))
         return value
 
@@ -354,14 +368,20 @@ class MVResourceType(MetadataValue):
     mandatory = False
 
     def __init__(self, value):
+        self.check(value)
+        self.value = value
+        return
+
+    @classmethod
+    def check(cls, value):
+        """raise ValueError if value is not valid"""
         if not isinstance(value, basestring):
             raise ValueError('resourcetype must be a basestring')
         parts = value.split('/', 1)
         if len(parts) != 2:
             raise ValueError('resourcetype must have the form resourceTypeGeneral/resourceType')
-        if parts[0] not in resourcetypegeneral_values:
+        if parts[0] not in _resourcetypegeneral_set:
             raise ValueError('bad value for resourceTypeGeneral')
-        self.value = value
         return
 
     def update_xml(self, doc):
@@ -606,7 +626,7 @@ class MVDescriptions(MetadataValue):
         value = []
         elements = doc.getElementsByTagName('descriptions')
         assert len(elements) == 1
-        for el in contributors_el.getElementsByTagName('description'):
+        for el in elements[0].getElementsByTagName('description'):
             type = el.getAttribute('descriptionType')
             description = xml_text(el)
             value.append((type, description))
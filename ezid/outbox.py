@@ -0,0 +1,226 @@
+"""durable write-behind queue for DOI updates
+
+    outbox = Outbox('outbox.db')
+    outbox.update_metadata(identifier, metadata)    # returns at once
+    outbox.update_landing_page(identifier, landing_page)
+
+    flusher = Flusher(outbox, auth)
+    flusher.start()
+
+writes are validated and stored in a local SQLite database.  pending
+writes to the same identifier are merged, so only the latest landing
+page and metadata are sent.  flush() (run periodically by a Flusher)
+sends due writes in batches with bulk.run(), retrying failures with
+exponential backoff; writes that keep failing stay queued (see
+errors()) until they succeed or are discarded.
+
+flushed writes go through ezid.update(), so observers (see
+ezid.observers) are passed the DOI's full landing page and metadata
+once each write has been sent; when only one of them is queued the
+other is read back from EZID.
+"""
+
+import time
+import json
+import threading
+import sqlite3
+import ezid
+from . import bulk
+
+_schema = """
+CREATE TABLE IF NOT EXISTS outbox (identifier TEXT PRIMARY KEY,
+                                   landing_page TEXT,
+                                   metadata TEXT,
+                                   version INTEGER NOT NULL,
+                                   enqueued REAL NOT NULL,
+                                   attempts INTEGER NOT NULL,
+                                   next_attempt REAL NOT NULL,
+                                   last_error TEXT);
+"""
+
+class Outbox:
+
+    """queue of pending writes in the SQLite database path
+
+    may be shared between threads
+    """
+
+    def __init__(self, path, min_backoff=1, max_backoff=600):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(_schema)
+        self.lock = threading.Lock()
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.failed = 0
+        return
+
+    def close(self):
+        self.db.close()
+        return
+
+    def update_metadata(self, identifier, metadata):
+        md2 = ezid.validate_metadata(metadata)
+        self._enqueue(identifier, None, json.dumps(md2))
+        return
+
+    def update_landing_page(self, identifier, landing_page):
+        self._enqueue(identifier, landing_page, None)
+        return
+
+    def _enqueue(self, identifier, landing_page, metadata):
+        now = time.time()
+        with self.lock:
+            with self.db:
+                query = 'SELECT landing_page, metadata FROM outbox ' + \
+                        'WHERE identifier = ?'
+                row = self.db.execute(query, (identifier, )).fetchone()
+                if row is None:
+                    query = 'INSERT INTO outbox ' + \
+                            'VALUES (?, ?, ?, 1, ?, 0, ?, NULL)'
+                    self.db.execute(query, (identifier,
+                                            landing_page,
+                                            metadata,
+                                            now,
+                                            now))
+                else:
+                    if landing_page is None:
+                        landing_page = row[0]
+                    if metadata is None:
+                        metadata = row[1]
+                    query = 'UPDATE outbox SET landing_page = ?, ' + \
+                            'metadata = ?, version = version + 1 ' + \
+                            'WHERE identifier = ?'
+                    self.db.execute(query, (landing_page,
+                                            metadata,
+                                            identifier))
+        return
+
+    def discard(self, identifier):
+        """drop the pending write for identifier (e.g. one EZID rejects)"""
+        with self.lock:
+            with self.db:
+                self.db.execute('DELETE FROM outbox WHERE identifier = ?',
+                                (identifier, ))
+        return
+
+    def errors(self):
+        """return a list of (identifier, attempts, last error) for writes
+        that have failed"""
+        query = 'SELECT identifier, attempts, last_error FROM outbox ' + \
+                'WHERE attempts > 0 ORDER BY enqueued'
+        with self.lock:
+            return self.db.execute(query).fetchall()
+
+    def depth(self):
+        """return the number of identifiers with pending writes"""
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def lag(self):
+        """return the age in seconds of the oldest pending write"""
+        with self.lock:
+            query = 'SELECT MIN(enqueued) FROM outbox'
+            oldest = self.db.execute(query).fetchone()[0]
+        if oldest is None:
+            return 0.0
+        return time.time() - oldest
+
+    def stats(self):
+        """return a dictionary of queue metrics"""
+        with self.lock:
+            query = 'SELECT COUNT(*) FROM outbox WHERE attempts > 0'
+            retrying = self.db.execute(query).fetchone()[0]
+        return {'depth': self.depth(),
+                'lag': self.lag(),
+                'retrying': retrying,
+                'sent': self.sent,
+                'failed': self.failed}
+
+    def _due(self, limit):
+        query = 'SELECT identifier, landing_page, metadata, version, ' + \
+                'attempts FROM outbox WHERE next_attempt <= ? ' + \
+                'ORDER BY enqueued LIMIT ?'
+        with self.lock:
+            return self.db.execute(query, (time.time(), limit)).fetchall()
+
+    def _sent(self, identifier, version):
+        # a write that arrived while sending bumped the version and
+        # stays queued
+        with self.lock:
+            with self.db:
+                query = 'DELETE FROM outbox ' + \
+                        'WHERE identifier = ? AND version = ?'
+                self.db.execute(query, (identifier, version))
+                query = 'UPDATE outbox SET attempts = 0, last_error = NULL ' + \
+                        'WHERE identifier = ?'
+                self.db.execute(query, (identifier, ))
+            self.sent += 1
+        return
+
+    def _failed(self, identifier, attempts, error):
+        backoff = min(self.max_backoff, self.min_backoff * 2 ** attempts)
+        with self.lock:
+            with self.db:
+                query = 'UPDATE outbox SET attempts = attempts + 1, ' + \
+                        'next_attempt = ?, last_error = ? ' + \
+                        'WHERE identifier = ?'
+                self.db.execute(query, (time.time() + backoff,
+                                        str(error),
+                                        identifier))
+            self.failed += 1
+        return
+
+    def flush(self, auth, concurrency=4, batch_size=100):
+        """send due writes until none are left
+
+        returns (number sent, number failed)
+        """
+        def send(row):
+            (identifier, landing_page, metadata, version, attempts) = row
+            if metadata is not None:
+                metadata = json.loads(metadata)
+            ezid.update(identifier, auth, landing_page, metadata)
+            return
+        n_sent = 0
+        n_failed = 0
+        while True:
+            rows = self._due(batch_size)
+            if not rows:
+                break
+            for (row, result, error) in bulk.run(send, rows, concurrency):
+                if error is None:
+                    self._sent(row[0], row[3])
+                    n_sent += 1
+                else:
+                    self._failed(row[0], row[4], error)
+                    n_failed += 1
+        return (n_sent, n_failed)
+
+class Flusher(threading.Thread):
+
+    """background thread that flushes an outbox every interval seconds"""
+
+    def __init__(self, outbox, auth, interval=5, concurrency=4):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.outbox = outbox
+        self.auth = auth
+        self.interval = interval
+        self.concurrency = concurrency
+        self.stopping = threading.Event()
+        return
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.outbox.flush(self.auth, self.concurrency)
+            self.stopping.wait(self.interval)
+        return
+
+    def stop(self):
+        """stop after the current flush; queued writes are kept"""
+        self.stopping.set()
+        self.join()
+        return
+
+# eof
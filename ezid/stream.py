@@ -0,0 +1,64 @@
+"""streaming reader for files of many DataCite records
+
+    for (identifier, metadata) in iter_resources('harvest.xml'):
+        ...
+
+the file is read incrementally; each <resource> element is built as a
+small DOM, decoded with the MV* extract_from_xml() methods as in
+xml_to_metadata() and freed before the next is read, so memory use
+does not grow with the size of the file.  resources may be wrapped in
+other elements (OAI-PMH responses, for instance).
+"""
+
+import xml.dom.pulldom
+import ezid
+from .xml_utils import xml_text
+
+def iter_resources(source, bufsize=64*1024, on_error=None):
+    """read DataCite records from source (a file name or file object)
+
+    yields (identifier, metadata) for each <resource> element; the
+    identifier is None if the resource has none
+
+    if on_error is given, resources whose metadata cannot be decoded
+    are skipped and on_error(identifier, exception) is called for each;
+    otherwise the exception is raised.  a file that is not well-formed
+    XML cannot be read past the error, which is always raised
+    """
+    events = xml.dom.pulldom.parse(source, bufsize=bufsize)
+    for (event, node) in events:
+        if event != xml.dom.pulldom.START_ELEMENT:
+            continue
+        if node.localName != 'resource':
+            continue
+        events.expandNode(node)
+        try:
+            identifier = resource_identifier(node)
+            try:
+                metadata = resource_metadata(node)
+            except (ValueError, AssertionError) as exc:
+                if on_error is None:
+                    raise
+                on_error(identifier, exc)
+                continue
+            yield (identifier, metadata)
+        finally:
+            node.unlink()
+    return
+
+def resource_identifier(el):
+    """return the identifier of a <resource> DOM element, or None"""
+    elements = el.getElementsByTagName('identifier')
+    if not elements:
+        return None
+    identifier = xml_text(elements[0]).strip()
+    if identifier.lower().startswith('doi:'):
+        identifier = identifier[4:]
+    return identifier
+
+def resource_metadata(el):
+    """return the metadata dictionary for a <resource> DOM element, as
+    xml_to_metadata() would"""
+    return ezid._extract(el, ezid.metadata_values)
+
+# eof
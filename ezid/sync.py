@@ -0,0 +1,253 @@
+"""reconcile EZID with a local catalog
+
+    state = StateCache('state.db')
+    state.load(harvester.harvest(path))
+    actions = plan(catalog_entries(), state)
+    counts = sync(actions, auth, state, concurrency=8)
+
+plan() compares desired (identifier, landing_page, metadata) entries
+against the remote state recorded in a StateCache, using per-field
+hashes (see ezid.canonical), and yields an Action for each entry.
+execute() and sync() send only the writes the plan calls for and record
+the new remote state as they complete.
+"""
+
+import json
+import threading
+import sqlite3
+import ezid
+from . import bulk
+from .canonical import field_hashes
+
+CREATE = 'create'
+UPDATE = 'update'
+UPDATE_METADATA = 'update_metadata'
+UPDATE_TARGET = 'update_target'
+NOOP = 'noop'
+
+_schema = """
+CREATE TABLE IF NOT EXISTS state (identifier TEXT PRIMARY KEY,
+                                  hashes TEXT NOT NULL);
+"""
+
+class StateCache:
+
+    """field hashes of the remote records, kept in the SQLite database path
+
+    may be shared between threads
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(_schema)
+        self.lock = threading.Lock()
+        return
+
+    def close(self):
+        self.db.close()
+        return
+
+    def get(self, identifier):
+        """return the field hashes for identifier, or None if unknown"""
+        query = 'SELECT hashes FROM state WHERE identifier = ?'
+        with self.lock:
+            row = self.db.execute(query, (identifier, )).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def _put(self, identifier, landing_page, metadata):
+        try:
+            hashes = field_hashes(landing_page, metadata)
+        except ValueError:
+            # invalid remote metadata never matches, so it is rewritten
+            hashes = {}
+        self.db.execute('INSERT OR REPLACE INTO state VALUES (?, ?)',
+                        (identifier, json.dumps(hashes)))
+        return
+
+    def put(self, identifier, landing_page, metadata):
+        with self.lock:
+            with self.db:
+                self._put(identifier, landing_page, metadata)
+        return
+
+    def load(self, records):
+        """record the state of (identifier, landing_page, metadata) records
+
+        records is an iterable such as the one returned by
+        Harvester.harvest()
+        """
+        with self.lock:
+            with self.db:
+                for (identifier, landing_page, metadata) in records:
+                    if metadata is None:
+                        metadata = {}
+                    self._put(identifier, landing_page, metadata)
+        return
+
+    def observe(self, identifier, landing_page, metadata):
+        """observer for ezid.observers: records writes made elsewhere"""
+        self.put(identifier, landing_page, metadata)
+        return
+
+class Action:
+
+    """a planned write
+
+    kind is one of CREATE, UPDATE, UPDATE_METADATA, UPDATE_TARGET or
+    NOOP; changed is the list of fields that differ from the remote
+    state ("_target" for the landing page)
+
+    identifier is None for a create that mints on a shoulder
+    """
+
+    def __init__(self, kind, identifier, landing_page, metadata, changed):
+        self.kind = kind
+        self.identifier = identifier
+        self.landing_page = landing_page
+        self.metadata = metadata
+        self.changed = changed
+        return
+
+    def __repr__(self):
+        return '<Action %s %s>' % (self.kind, self.identifier)
+
+def plan(entries, state):
+    """compare desired entries against state
+
+    entries is an iterable of (identifier, landing_page, metadata); the
+    identifier may be None for records to be minted
+
+    yields an Action for each entry; raises ValueError for invalid
+    metadata
+    """
+    for (identifier, landing_page, metadata) in entries:
+        desired = field_hashes(landing_page, metadata)
+        if identifier is None:
+            current = None
+        else:
+            current = state.get(identifier)
+        if current is None:
+            yield Action(CREATE,
+                         identifier,
+                         landing_page,
+                         metadata,
+                         sorted(desired))
+            continue
+        keys = set(desired) | set(current)
+        changed = sorted( k for k in keys if desired.get(k) != current.get(k) )
+        target_changed = '_target' in changed
+        metadata_changed = len(changed) > int(target_changed)
+        if target_changed and metadata_changed:
+            kind = UPDATE
+        elif metadata_changed:
+            kind = UPDATE_METADATA
+        elif target_changed:
+            kind = UPDATE_TARGET
+        else:
+            kind = NOOP
+        yield Action(kind, identifier, landing_page, metadata, changed)
+    return
+
+def _writer(auth, state, doi_prefix, minter):
+    def write(action):
+        identifier = action.identifier
+        md2 = ezid.validate_metadata(action.metadata)
+        if action.kind == CREATE:
+            if identifier is not None:
+                try:
+                    ezid.create(identifier, action.landing_page, md2, auth)
+                except ezid.ExistsError:
+                    # the DOI exists but was not in the state: write over it
+                    ezid.update(identifier,
+                                auth,
+                                action.landing_page,
+                                md2,
+                                record=(action.landing_page, md2))
+            elif minter is not None:
+                identifier = minter.mint(action.landing_page, md2)
+            elif doi_prefix is not None:
+                identifier = ezid.mint(action.landing_page,
+                                       md2,
+                                       doi_prefix,
+                                       auth)
+            else:
+                raise ValueError('no DOI prefix or minter for create')
+        else:
+            landing_page = None
+            metadata = None
+            if action.kind in (UPDATE, UPDATE_TARGET):
+                landing_page = action.landing_page
+            if action.kind in (UPDATE, UPDATE_METADATA):
+                metadata = md2
+            ezid.update(identifier,
+                        auth,
+                        landing_page,
+                        metadata,
+                        record=(action.landing_page, md2))
+        if state is not None:
+            state.put(identifier, action.landing_page, md2)
+        return identifier
+    return write
+
+def execute(actions,
+            auth,
+            state=None,
+            doi_prefix=None,
+            minter=None,
+            concurrency=4,
+            stats=None):
+    """carry out the writes in actions using concurrency worker threads
+
+    NOOP actions are skipped.  creates without an identifier are minted
+    with minter (an IdempotentMinter) if given, otherwise on doi_prefix;
+    a create for an identifier that already exists updates it instead.
+    state, if given, is updated as writes complete.
+
+    yields (action, identifier, error) as writes complete; see
+    bulk.run() for stats
+    """
+    writes = ( a for a in actions if a.kind != NOOP )
+    write = _writer(auth, state, doi_prefix, minter)
+    return bulk.run(write, writes, concurrency, stats)
+
+def sync(actions,
+         auth,
+         state=None,
+         doi_prefix=None,
+         minter=None,
+         concurrency=4,
+         progress=None):
+    """execute a plan and return a dictionary of counts by action kind
+
+    NOOP actions are counted as planned, other kinds as their writes
+    succeed; failed writes are counted under "error" instead.
+    progress, if given, is called as progress(stats, action, error)
+    after each write completes
+    """
+    counts = {}
+    def count_noops(actions):
+        for action in actions:
+            if action.kind == NOOP:
+                counts[NOOP] = counts.get(NOOP, 0) + 1
+            yield action
+    stats = bulk.Stats()
+    results = execute(count_noops(actions),
+                      auth,
+                      state,
+                      doi_prefix,
+                      minter,
+                      concurrency,
+                      stats)
+    for (action, identifier, error) in results:
+        if error is None:
+            kind = action.kind
+        else:
+            kind = 'error'
+        counts[kind] = counts.get(kind, 0) + 1
+        if progress is not None:
+            progress(stats, action, error)
+    return counts
+
+# eof
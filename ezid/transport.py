@@ -0,0 +1,454 @@
+"""HTTP transports
+
+a transport makes the HTTP requests for ezid.connection.request():
+
+    transport.request(method, url, headers, data, auth, timeout,
+                      allow_redirects)
+
+returns a response with status_code, headers, iter_content(chunk_size)
+and close(), and raises RequestTimeoutError if the request times out.
+the transport in use is ezid.connection.transport:
+
+    ezid.connection.transport = HTTP2Transport()
+
+RequestsTransport (the default) and HTTP2Transport send
+Accept-Encoding: gzip, deflate, so servers that support it compress
+their responses; compressed bodies are decompressed as they are read.
+
+transports may be shared between threads.
+"""
+
+import threading
+import collections
+import urlparse
+import Queue
+import requests
+import requests.adapters
+import requests.structures
+import requests.utils
+from .exceptions import *
+
+accept_encoding = 'gzip, deflate'
+
+class Transport:
+
+    """base class for transports"""
+
+    def request(self,
+                method,
+                url,
+                headers=None,
+                data=None,
+                auth=None,
+                timeout=None,
+                allow_redirects=True):
+        raise NotImplementedError()
+
+class RequestsTransport(Transport):
+
+    """HTTP/1.1 transport using a requests session (and its connection
+    pool)
+
+    requests sessions are not safe to share between threads, so each 
+    thread gets its own
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        return
+
+    @property
+    def session(self):
+        try:
+            return self.local.session
+        except AttributeError:
+            session = requests.Session()
+            self._configure(session)
+            self.local.session = session
+            return session
+
+    def _configure(self, session):
+        """set up a new session"""
+        session.headers['Accept-Encoding'] = accept_encoding
+        return
+
+    def request(self,
+                method,
+                url,
+                headers=None,
+                data=None,
+                auth=None,
+                timeout=None,
+                allow_redirects=True):
+        try:
+            return self.session.request(method,
+                                        url,
+                                        headers=headers,
+                                        data=data,
+                                        auth=auth,
+                                        timeout=timeout,
+                                        allow_redirects=allow_redirects,
+                                        stream=True)
+        except requests.exceptions.Timeout as exc:
+            raise RequestTimeoutError('%s %s timed out: %s' % (method,
+                                                               url,
+                                                               exc))
+
+class HTTP2Transport(RequestsTransport):
+
+    """HTTP/2 transport: requests to each host are multiplexed over a
+    single connection, shared by all threads
+
+    requires hyper (0.7).  URLs starting with one of prefixes are sent over
+    HTTP/2 (https:// negotiates it with ALPN, http:// assumes the server
+    speaks it); others, such as the resolver's plain http:// URLs, use
+    HTTP/1.1
+    """
+
+    def __init__(self, prefixes=('https://', )):
+        RequestsTransport.__init__(self)
+        self.prefixes = prefixes
+        self.adapter = HTTP2Adapter()
+        return
+
+    def _configure(self, session):
+        RequestsTransport._configure(self, session)
+        for prefix in self.prefixes:
+            session.mount(prefix, self.adapter)
+        return
+
+# headers that HTTP/2 does not allow
+_connection_headers = ('connection',
+                       'keep-alive',
+                       'proxy-connection',
+                       'transfer-encoding',
+                       'upgrade')
+
+class HTTP2Adapter(requests.adapters.BaseAdapter):
+
+    """requests transport adapter that sends requests over hyper HTTP/2
+    connections, one per host, shared by the threads using the adapter
+
+    each exchange runs in a thread of its own, so a request that times
+    out is abandoned (and its stream reset) without disturbing the
+    other streams on the connection
+    """
+
+    def __init__(self):
+        try:
+            from hyper import HTTP20Connection
+        except ImportError:
+            raise ImportError('HTTP2Transport requires hyper')
+        super(HTTP2Adapter, self).__init__()
+        self.connection_class = HTTP20Connection
+        self.lock = threading.Lock()
+        # (host, port, scheme) -> HTTP20Connection
+        self.connections = {}
+        return
+
+    def _connection(self, key):
+        with self.lock:
+            if key not in self.connections:
+                (host, port, scheme) = key
+                conn = self.connection_class(host,
+                                             port,
+                                             secure=(scheme == 'https'))
+                # hyper holds the read lock while it waits on the socket
+                # for a stream, and the thread releasing it usually takes
+                # it straight back, so threads waiting for other streams
+                # starve; take turns instead
+                conn._read_lock = _FairRLock()
+                self.connections[key] = conn
+            return self.connections[key]
+
+    def _discard(self, key, conn):
+        # a failed connection is replaced by the next request
+        with self.lock:
+            if self.connections.get(key) is conn:
+                del self.connections[key]
+        try:
+            conn.close()
+        except Exception:
+            pass
+        return
+
+    def send(self,
+             request,
+             stream=False,
+             timeout=None,
+             verify=True,
+             cert=None,
+             proxies=None):
+        if isinstance(timeout, tuple):
+            (connect_timeout, read_timeout) = timeout
+        else:
+            (connect_timeout, read_timeout) = (timeout, timeout)
+        if connect_timeout is None or read_timeout is None:
+            wait = None
+        else:
+            wait = connect_timeout + read_timeout
+        parts = urlparse.urlsplit(request.url)
+        port = parts.port
+        if port is None:
+            port = 443 if parts.scheme == 'https' else 80
+        key = (parts.hostname, port, parts.scheme)
+        selector = parts.path or '/'
+        if parts.query:
+            selector += '?' + parts.query
+        headers = dict( (name, value)
+                        for (name, value) in request.headers.iteritems()
+                        if name.lower() not in _connection_headers )
+        conn = self._connection(key)
+        exchange = _Exchange(conn, request.method, selector, request.body,
+                             headers)
+        if not exchange.wait(wait):
+            raise requests.exceptions.ReadTimeout('%s %s timed out' % \
+                                                  (request.method,
+                                                   request.url),
+                                                  request=request)
+        if exchange.error is not None:
+            self._discard(key, conn)
+            raise requests.exceptions.ConnectionError(exchange.error,
+                                                      request=request)
+        r = exchange.response
+        response = requests.models.Response()
+        response.status_code = r.status
+        response.reason = r.reason
+        headers = requests.structures.CaseInsensitiveDict()
+        for (name, value) in r.headers.iter_raw():
+            headers[name] = value
+        response.headers = headers
+        response.encoding = requests.utils.get_encoding_from_headers(headers)
+        response.raw = _Body(r, read_timeout)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        if not stream:
+            response.content
+        return response
+
+    def close(self):
+        with self.lock:
+            connections = self.connections.values()
+            self.connections = {}
+        for conn in connections:
+            conn.close()
+        return
+
+class _FairRLock:
+
+    """reentrant lock granted in the order it is asked for"""
+
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.owner = None
+        self.count = 0
+        self.waiting = collections.deque()
+        return
+
+    def acquire(self, blocking=True):
+        me = threading.current_thread()
+        with self.cond:
+            if self.owner is me:
+                self.count += 1
+                return True
+            if self.owner is None and not self.waiting:
+                self.owner = me
+                self.count = 1
+                return True
+            if not blocking:
+                return False
+            self.waiting.append(me)
+            while self.owner is not None or self.waiting[0] is not me:
+                self.cond.wait()
+            self.waiting.popleft()
+            self.owner = me
+            self.count = 1
+        return True
+
+    def release(self):
+        with self.cond:
+            if self.owner is not threading.current_thread():
+                raise RuntimeError('cannot release un-acquired lock')
+            self.count -= 1
+            if self.count == 0:
+                self.owner = None
+                self.cond.notify_all()
+        return
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+class _Exchange:
+
+    """sends a request and waits for the response headers in a thread
+    of its own"""
+
+    def __init__(self, conn, method, selector, body, headers):
+        self.conn = conn
+        self.method = method
+        self.selector = selector
+        self.body = body
+        self.headers = headers
+        self.response = None
+        self.error = None
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.abandoned = False
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+        return
+
+    def _run(self):
+        try:
+            stream_id = self.conn.request(self.method,
+                                          self.selector,
+                                          self.body,
+                                          self.headers)
+            self.response = self.conn.get_response(stream_id)
+        except Exception as exc:
+            self.error = exc
+        with self.lock:
+            self.done.set()
+            abandoned = self.abandoned
+        if abandoned and self.response is not None:
+            self.response.close()
+        return
+
+    def wait(self, timeout):
+        """return True if the exchange finished within timeout seconds;
+        if not it is abandoned"""
+        self.done.wait(timeout)
+        with self.lock:
+            if not self.done.is_set():
+                self.abandoned = True
+                return False
+        return True
+
+class _Body:
+
+    """file-like body of an HTTP/2 response
+
+    the body is read (and decompressed, by hyper) in a thread of its
+    own, a few chunks ahead of the reader; read() raises ReadTimeout if
+    no data arrives within timeout seconds
+    """
+
+    def __init__(self, response, timeout):
+        self.response = response
+        self.timeout = timeout
+        self.chunks = Queue.Queue(maxsize=4)
+        self.buffer = ''
+        self.finished = False
+        self.closed = threading.Event()
+        thread = threading.Thread(target=self._pump)
+        thread.daemon = True
+        thread.start()
+        return
+
+    def _put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _pump(self):
+        try:
+            # data is passed on as it arrives
+            for data in self.response.read_chunked():
+                if data and not self._put(data):
+                    return
+            self._put('')
+        except Exception as exc:
+            self._put(exc)
+        return
+
+    def read(self, amt=None, decode_content=True):
+        while not self.finished:
+            if amt is not None and len(self.buffer) >= amt:
+                break
+            try:
+                item = self.chunks.get(timeout=self.timeout)
+            except Queue.Empty:
+                self.close()
+                raise requests.exceptions.ReadTimeout('read timed out')
+            if isinstance(item, Exception):
+                self.finished = True
+                self.close()
+                raise requests.exceptions.ConnectionError(item)
+            if item:
+                self.buffer += item
+            else:
+                self.finished = True
+        if amt is None:
+            (data, self.buffer) = (self.buffer, '')
+        else:
+            (data, self.buffer) = (self.buffer[:amt], self.buffer[amt:])
+        return data
+
+    def close(self):
+        if not self.closed.is_set():
+            self.closed.set()
+            self.response.close()
+        return
+
+    def release_conn(self):
+        return
+
+class LocalResponse:
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        return
+
+    def iter_content(self, chunk_size):
+        for i in xrange(0, len(self.content), chunk_size):
+            yield self.content[i:i+chunk_size]
+        return
+
+    def close(self):
+        return
+
+class LocalTransport(Transport):
+
+    """in-process transport for tests and benchmarks
+
+    requests are passed to handler, which is called as:
+
+        handler(method, url, headers, data, auth)
+
+    and returns (status_code, headers, body); see ezid.local.LocalEZID
+
+    redirects are not followed
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        return
+
+    def request(self,
+                method,
+                url,
+                headers=None,
+                data=None,
+                auth=None,
+                timeout=None,
+                allow_redirects=True):
+        (status_code, headers, body) = self.handler(method,
+                                                    url,
+                                                    headers or {},
+                                                    data,
+                                                    auth)
+        return LocalResponse(status_code, headers, body)
+
+# eof
@@ -0,0 +1,56 @@
+"""shared setup for the tests: EZID is replaced by an in-process
+LocalEZID"""
+
+import unittest
+import threading
+import ezid
+from ezid import connection
+from ezid.local import LocalEZID
+from ezid.transport import LocalTransport
+
+auth = ('user', 'password')
+
+metadata = {'creators': [('Doe, Jane', 'Example University')],
+            'title': 'Test dataset',
+            'publisher': 'Example University',
+            'publicationyear': '2015',
+            'resourcetype': 'Dataset/Imaging'}
+
+class CountingHandler:
+
+    """passes requests to a LocalEZID and counts them by method
+
+    may be called from several threads
+    """
+
+    def __init__(self, local_ezid):
+        self.local_ezid = local_ezid
+        self.counts = {}
+        self.lock = threading.Lock()
+        return
+
+    def __call__(self, method, url, headers, data, auth):
+        with self.lock:
+            self.counts[method] = self.counts.get(method, 0) + 1
+        return self.local_ezid(method, url, headers, data, auth)
+
+class LocalEZIDTestCase(unittest.TestCase):
+
+    latency = 0
+
+    def setUp(self):
+        self.saved = (connection.transport, ezid.base_url, ezid.observers)
+        self.local_ezid = LocalEZID(latency=self.latency)
+        self.handler = CountingHandler(self.local_ezid)
+        connection.transport = LocalTransport(self.handler)
+        ezid.base_url = 'https://ezid.example.org'
+        ezid.observers = []
+        for breaker in connection.breakers.itervalues():
+            breaker.reset()
+        return
+
+    def tearDown(self):
+        (connection.transport, ezid.base_url, ezid.observers) = self.saved
+        return
+
+# eof
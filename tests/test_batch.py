@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import unittest
+import ezid
+from ezid.batch import MetadataBatch
+from ezid.membench import synthetic_metadata
+from support import metadata
+
+full_metadata = {'creators': ['Doe, Jane',
+                              (u'M\xfcller, J\xfcrgen', 'Example & Co.')],
+                 'title': u'<Tricky> "title" & ☃',
+                 'publisher': 'Example University',
+                 'publicationyear': '2015',
+                 'subjects': ['one',
+                              ('two', 'scheme'),
+                              ('three', 'scheme', 'http://example.org/?a&b')],
+                 'contributors': [('Editor', 'Roe, Richard'),
+                                  ('DataManager', 'Poe, Edgar', 'Baltimore')],
+                 'dates': [('Created', '2015-01-01'),
+                           ('Updated', '2015-02-01')],
+                 'resourcetype': 'Dataset/Imaging',
+                 'alternateidentifiers': [('local', 'X1')],
+                 'relatedidentifiers': [('10.5072/REL', 'DOI', 'IsPartOf')],
+                 'sizes': ['1 GB', '3 files'],
+                 'formats': ['text/csv'],
+                 'version': '1.0',
+                 'rights': ['CC0', ('CC-BY', 'http://example.org/by')],
+                 'descriptions': [('Abstract', 'a\nb  c\ttabbed')],
+                 'geolocations': ['Here', 'There']}
+
+class BatchOutputTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [full_metadata, metadata] + \
+                       [ synthetic_metadata(i) for i in xrange(20) ]
+        self.identifiers = [None, '10.5072/FK2A'] + \
+                           [ '10.5072/FK2%d' % i for i in xrange(20) ]
+        self.batch = MetadataBatch.from_records(self.records)
+        return
+
+    def test_same_xml(self):
+        for identifiers in (None, self.identifiers):
+            xmls = list(self.batch.iter_xml(identifiers))
+            self.assertEqual(len(xmls), len(self.records))
+            for (i, xml) in enumerate(xmls):
+                md2 = ezid.validate_metadata(self.records[i])
+                if identifiers is None:
+                    identifier = None
+                else:
+                    identifier = identifiers[i]
+                expected = ezid.create_datacite_xml(identifier, md2)
+                self.assertEqual(type(xml), type(expected))
+                self.assertEqual(xml.encode('utf-8'),
+                                 expected.encode('utf-8'))
+        return
+
+    def test_same_request_bodies(self):
+        # the request bodies of the records with ASCII metadata;
+        # _create_request_body() quotes the XML as it is given
+        records = self.records[1:]
+        identifiers = self.identifiers[1:]
+        landing_pages = [ 'http://example.org/%d' % i
+                          for i in xrange(len(records)) ]
+        batch = MetadataBatch.from_records(records)
+        bodies = list(batch.iter_request_bodies(landing_pages, identifiers))
+        for (i, body) in enumerate(bodies):
+            md2 = ezid.validate_metadata(records[i])
+            self.assertEqual(body,
+                             ezid._create_request_body(landing_pages[i],
+                                                       identifiers[i],
+                                                       md2))
+        return
+
+    def test_normalized_like_validate_metadata(self):
+        self.batch.validate()
+        for (i, md) in enumerate(self.batch):
+            md2 = ezid.validate_metadata(self.records[i])
+            self.assertEqual(md, md2)
+        return
+
+class BatchValidationTestCase(unittest.TestCase):
+
+    def assertRecordError(self, records, message):
+        batch = MetadataBatch.from_records(records)
+        try:
+            batch.validate()
+        except ValueError as exc:
+            self.assertEqual(str(exc), message)
+        else:
+            self.fail('no ValueError')
+        return
+
+    def assertSameError(self, bad, n=3):
+        # the message for record n is that of validate_metadata()
+        try:
+            ezid.validate_metadata(bad)
+        except ValueError as exc:
+            message = str(exc)
+        else:
+            self.fail('no ValueError from validate_metadata()')
+        records = [metadata] * n + [bad, metadata]
+        self.assertRecordError(records, 'record %d: %s' % (n, message))
+        return
+
+    def test_string_fields(self):
+        self.assertSameError(dict(metadata, publicationyear='15'))
+        self.assertSameError(dict(metadata, publicationyear=2015))
+        self.assertSameError(dict(metadata, resourcetype='Dataset'))
+        self.assertSameError(dict(metadata, resourcetype='Data/Imaging'))
+        self.assertSameError(dict(metadata, resourcetype=1))
+        self.assertSameError(dict(metadata, title=['a', 'title']), n=0)
+        self.assertSameError(dict(metadata, version=1.0), n=1)
+        return
+
+    def test_list_fields(self):
+        self.assertSameError(dict(metadata, dates=[('Created', 2015)]))
+        self.assertSameError(dict(metadata, creators=[('a', 'b', 'c')]))
+        self.assertSameError(dict(metadata, rights=[1]), n=5)
+        return
+
+    def test_missing_mandatory(self):
+        for key in ('title', 'publicationyear', 'creators'):
+            bad = dict(metadata)
+            del bad[key]
+            self.assertRecordError([metadata, metadata, bad],
+                                   'record 2: missing mandatory metadata '
+                                   'key "%s"' % key)
+        return
+
+    def test_append_errors(self):
+        batch = MetadataBatch.from_records([metadata])
+        self.assertRaises(ValueError, batch.append, dict(metadata, size='1'))
+        try:
+            batch.append(dict(metadata, formats='text/csv'))
+        except ValueError as exc:
+            self.assertEqual(str(exc),
+                             'record 1: formats must be a list or a tuple')
+        else:
+            self.fail('no ValueError')
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
@@ -0,0 +1,184 @@
+import unittest
+import threading
+import time
+import ezid
+from ezid import bulk
+
+class RunTestCase(unittest.TestCase):
+
+    def test_results_and_errors(self):
+        def f(item):
+            if item % 3 == 0:
+                raise ValueError(item)
+            return item * 2
+        stats = bulk.Stats()
+        results = list(bulk.run(f, xrange(30), 4, stats))
+        self.assertEqual(sorted( item for (item, r, e) in results ),
+                         range(30))
+        for (item, result, error) in results:
+            if item % 3 == 0:
+                self.assertEqual(result, None)
+                self.assertIsInstance(error, ValueError)
+            else:
+                self.assertEqual((result, error), (item * 2, None))
+        self.assertEqual((stats.count, stats.errors), (30, 10))
+        self.assertEqual(len(stats.latencies), 30)
+        self.assertNotEqual(stats.end, None)
+        return
+
+    def test_concurrency(self):
+        lock = threading.Lock()
+        in_flight = [0, 0]
+        def f(item):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return item
+        self.assertEqual(len(list(bulk.run(f, xrange(40), 5))), 40)
+        self.assertEqual(in_flight[1], 5)
+        self.assertRaises(ValueError, list, bulk.run(f, [], 0))
+        return
+
+    def test_items_read_lazily(self):
+        read = []
+        def items():
+            for i in xrange(1000):
+                read.append(i)
+                yield i
+        go = threading.Event()
+        def f(item):
+            go.wait()
+            return item
+        results = bulk.run(f, items(), 2)
+        thread = threading.Thread(target=lambda: results.next())
+        thread.start()
+        time.sleep(0.05)
+        # while the workers are busy, a few items per worker are read
+        # ahead
+        self.assertTrue(len(read) < 10, len(read))
+        go.set()
+        thread.join()
+        self.assertEqual(len(list(results)), 999)
+        return
+
+    def test_feed_error(self):
+        def items():
+            yield 1
+            yield 2
+            raise IOError('read failed')
+        results = bulk.run(lambda item: item, items(), 2)
+        self.assertEqual(sorted([results.next(), results.next()]),
+                         [(1, 1, None), (2, 2, None)])
+        self.assertRaises(IOError, list, results)
+        return
+
+class AdaptiveLimiterTestCase(unittest.TestCase):
+
+    """the limiter is given the completion times, so these tests do not
+    depend on timing"""
+
+    def setUp(self):
+        self.limiter = bulk.AdaptiveLimiter(4, minimum=2, maximum=16)
+        self.now = 100.0
+        return
+
+    def complete(self, latency, error=None, interval=0.01):
+        """acquire and release with the given outcome, interval seconds
+        after the last completion"""
+        self.limiter.acquire()
+        self.now += interval
+        self.limiter.release(latency, error, self.now)
+        return
+
+    def test_additive_growth(self):
+        for i in xrange(8):
+            limit = self.limiter._limit
+            # one round trip's worth of completions
+            for j in xrange(self.limiter.limit):
+                self.complete(0.1)
+            self.assertTrue(limit + 0.5 < self.limiter._limit <= limit + 1,
+                            (limit, self.limiter._limit))
+        self.assertEqual(self.limiter.limit, 11)
+        return
+
+    def test_one_cut_per_round_trip(self):
+        for i in xrange(30):
+            self.complete(0.1)
+        limit = self.limiter._limit
+        # errors within one latency of the first cut do not cut again
+        for i in xrange(5):
+            self.complete(0.1, ezid.RequestTimeoutError('timed out'), interval=0.015)
+        self.assertEqual(self.limiter._limit, limit / 2)
+        self.complete(0.1, ezid.RequestTimeoutError('timed out'), interval=0.05)
+        self.assertEqual(self.limiter._limit, limit / 4)
+        return
+
+    def test_latency_spike_cuts(self):
+        for i in xrange(10):
+            self.complete(0.1)
+        limit = self.limiter._limit
+        # within tolerance
+        self.complete(0.19)
+        self.assertTrue(self.limiter._limit > limit)
+        limit = self.limiter._limit
+        self.complete(0.5)
+        self.assertEqual(self.limiter._limit, limit / 2)
+        return
+
+    def test_client_errors_do_not_cut(self):
+        for i in xrange(10):
+            self.complete(0.1)
+        limit = self.limiter._limit
+        for error in (ValueError('bad metadata'),
+                      KeyError('landing_page'),
+                      ezid.NotFoundError('10.5072/FK2X'),
+                      ezid.ExistsError('10.5072/FK2X')):
+            self.complete(5.0, error, interval=1)
+        # nor do they count as successes
+        self.assertEqual(self.limiter._limit, limit)
+        self.assertEqual(self.limiter.baseline, 0.1)
+        return
+
+    def test_bounds(self):
+        for i in xrange(500):
+            self.complete(0.1)
+        self.assertEqual(self.limiter.limit, 16)
+        for i in xrange(10):
+            self.complete(0.1, ezid.CircuitOpenError('ezid'), interval=1)
+        self.assertEqual(self.limiter.limit, 2)
+        self.assertRaises(ValueError, bulk.AdaptiveLimiter, 1, minimum=2)
+        self.assertRaises(ValueError, bulk.AdaptiveLimiter, 8, maximum=4)
+        return
+
+    def test_acquire_waits_for_limit(self):
+        for i in xrange(4):
+            self.limiter.acquire()
+        acquired = threading.Event()
+        def acquire():
+            self.limiter.acquire()
+            acquired.set()
+            return
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        self.limiter.release(0.1, now=self.now)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        self.assertEqual(self.limiter.in_flight, 4)
+        return
+
+    def test_run_with_limiter(self):
+        limiter = bulk.AdaptiveLimiter(2, maximum=4)
+        results = list(bulk.run(lambda item: item, xrange(50), limiter))
+        self.assertEqual(len(results), 50)
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertTrue(1 <= limiter.limit <= 4)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
@@ -0,0 +1,106 @@
+import unittest
+import sys
+import os
+import json
+import StringIO
+import ezid
+from ezid.__main__ import main
+from support import LocalEZIDTestCase, auth, metadata
+
+class CLITestCase(LocalEZIDTestCase):
+
+    def setUp(self):
+        LocalEZIDTestCase.setUp(self)
+        self.saved_env = dict(os.environ)
+        os.environ['EZID_USER'] = auth[0]
+        os.environ['EZID_PASSWORD'] = auth[1]
+        self.saved_files = (sys.stdin, sys.stdout, sys.stderr)
+        return
+
+    def tearDown(self):
+        (sys.stdin, sys.stdout, sys.stderr) = self.saved_files
+        os.environ.clear()
+        os.environ.update(self.saved_env)
+        LocalEZIDTestCase.tearDown(self)
+        return
+
+    def run_cli(self, args, lines):
+        sys.stdin = StringIO.StringIO(''.join( line + '\n'
+                                               for line in lines ))
+        sys.stdout = StringIO.StringIO()
+        sys.stderr = StringIO.StringIO()
+        status = main(args + ['--base-url', ezid.base_url])
+        results = [ json.loads(line)
+                    for line in sys.stdout.getvalue().splitlines() ]
+        return (status, results)
+
+    def test_mint(self):
+        lines = [ json.dumps({'key': i,
+                              'landing_page': 'http://example.org/%d' % i,
+                              'metadata': metadata})
+                  for i in xrange(10) ]
+        lines.append(json.dumps({'key': 'bad', 'metadata': metadata}))
+        (status, results) = self.run_cli(['mint', '-c', '4'], lines)
+        self.assertEqual(status, 1)
+        self.assertEqual(len(results), 11)
+        by_input = dict( (result['input'], result) for result in results )
+        self.assertEqual(sorted(by_input), sorted(lines))
+        self.assertIn('error', by_input[lines[-1]])
+        for (i, line) in enumerate(lines[:-1]):
+            result = by_input[line]
+            self.assertEqual(result['key'], i)
+            doi = ezid.DOI(result['identifier'])
+            self.assertEqual(doi.landing_page, 'http://example.org/%d' % i)
+        self.assertIn('11 items, 1 errors', sys.stderr.getvalue())
+        return
+
+    def test_update(self):
+        identifier = ezid.mint('http://example.org/a',
+                               metadata,
+                               ezid.test_prefix,
+                               auth)
+        n_gets = self.handler.counts.get('GET', 0)
+        n_posts = self.handler.counts.get('POST', 0)
+        line = json.dumps({'identifier': identifier,
+                           'landing_page': 'http://example.org/b',
+                           'metadata': dict(metadata, title='New title')})
+        (status, results) = self.run_cli(['update'], [line])
+        self.assertEqual(status, 0)
+        self.assertEqual(results, [{'input': line,
+                                    'identifier': identifier,
+                                    'updated': ['metadata', 'landing_page']}])
+        # one POST and nothing read
+        self.assertEqual(self.handler.counts.get('GET', 0), n_gets)
+        self.assertEqual(self.handler.counts.get('POST', 0), n_posts + 1)
+        doi = ezid.DOI(identifier)
+        self.assertEqual(doi.landing_page, 'http://example.org/b')
+        self.assertEqual(doi.metadata['title'], 'New title')
+        return
+
+    def test_update_landing_page_only(self):
+        identifier = ezid.mint('http://example.org/a',
+                               metadata,
+                               ezid.test_prefix,
+                               auth)
+        line = json.dumps({'key': 'k',
+                           'identifier': identifier,
+                           'landing_page': 'http://example.org/b'})
+        (status, results) = self.run_cli(['update'], [line])
+        self.assertEqual(results[0]['key'], 'k')
+        self.assertEqual(results[0]['updated'], ['landing_page'])
+        doi = ezid.DOI(identifier)
+        self.assertEqual(doi.landing_page, 'http://example.org/b')
+        self.assertEqual(doi.metadata['title'], metadata['title'])
+        return
+
+    def test_get_missing(self):
+        (status, results) = self.run_cli(['get'], ['10.5072/FK2MISSING'])
+        self.assertEqual(status, 1)
+        self.assertEqual(results[0]['input'], '10.5072/FK2MISSING')
+        self.assertIn('error', results[0])
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
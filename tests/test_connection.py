@@ -0,0 +1,135 @@
+import time
+import unittest
+import ezid
+from ezid import connection
+from ezid.connection import CircuitBreaker
+from ezid.transport import LocalTransport
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('test',
+                                      failure_threshold=2,
+                                      reset_timeout=0.1)
+        return
+
+    def test_opens_after_threshold(self):
+        self.breaker.before()
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.before()
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertRaises(ezid.CircuitOpenError, self.breaker.before)
+        return
+
+    def test_success_resets_count(self):
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, 'closed')
+        return
+
+    def test_half_open_probe(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        time.sleep(0.1)
+        self.assertEqual(self.breaker.state, 'half-open')
+        # one probe is let through
+        self.breaker.before()
+        self.assertRaises(ezid.CircuitOpenError, self.breaker.before)
+        self.breaker.success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.before()
+        return
+
+    def test_failed_probe_reopens(self):
+        self.breaker.failure()
+        self.breaker.failure()
+        time.sleep(0.1)
+        self.breaker.before()
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertRaises(ezid.CircuitOpenError, self.breaker.before)
+        return
+
+class RequestTestCase(unittest.TestCase):
+
+    url = 'https://ezid.example.org/id/doi:10.5072/FK2TEST'
+
+    def setUp(self):
+        self.saved = (connection.transport, connection.breakers)
+        self.breaker = CircuitBreaker('ezid',
+                                      failure_threshold=1,
+                                      reset_timeout=0.1)
+        connection.breakers = {'ezid': self.breaker}
+        self.reply = (200, {}, 'success: doi:10.5072/FK2TEST')
+        self.delay = 0
+        self.error = None
+        connection.transport = LocalTransport(self.handler)
+        return
+
+    def tearDown(self):
+        (connection.transport, connection.breakers) = self.saved
+        return
+
+    def handler(self, method, url, headers, data, auth):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+    def get(self, **kwargs):
+        return connection.request('ezid', 'load', 'GET', self.url, **kwargs)
+
+    def test_request(self):
+        r = self.get()
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.content, 'success: doi:10.5072/FK2TEST')
+        self.assertEqual(self.breaker.state, 'closed')
+        return
+
+    def test_server_error_opens(self):
+        self.reply = (500, {}, 'error: internal')
+        self.assertEqual(self.get().status_code, 500)
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertRaises(ezid.CircuitOpenError, self.get)
+        return
+
+    def test_deadline_covers_headers(self):
+        self.delay = 1
+        t0 = time.time()
+        self.assertRaises(ezid.RequestTimeoutError, self.get, deadline=0.2)
+        self.assertTrue(time.time() - t0 < 0.5)
+        self.assertEqual(self.breaker.state, 'open')
+        return
+
+    def test_interrupted_probe_reopens(self):
+        self.breaker.failure()
+        time.sleep(0.1)
+        self.error = KeyboardInterrupt()
+        self.assertRaises(KeyboardInterrupt, self.get)
+        self.assertFalse(self.breaker.probing)
+        time.sleep(0.1)
+        self.error = None
+        self.get()
+        self.assertEqual(self.breaker.state, 'closed')
+        return
+
+    def test_interrupted_probe_without_deadline(self):
+        self.breaker.failure()
+        time.sleep(0.1)
+        self.error = KeyboardInterrupt()
+        self.assertRaises(KeyboardInterrupt,
+                          connection.request,
+                          'ezid',
+                          'download',
+                          'GET',
+                          self.url)
+        self.assertFalse(self.breaker.probing)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
@@ -0,0 +1,89 @@
+import os
+import time
+import tempfile
+import unittest
+import ezid
+from ezid.harvest import Harvester
+from support import LocalEZIDTestCase, auth, metadata
+
+# a valid DataCite kernel-3 record with only the mandatory elements
+minimal_xml = """<?xml version="1.0"?>
+<resource xmlns="http://datacite.org/schema/kernel-3">
+  <identifier identifierType="DOI">10.5072/FK2MIN</identifier>
+  <creators>
+    <creator><creatorName>Doe, Jane</creatorName></creator>
+  </creators>
+  <titles><title>Minimal</title></titles>
+  <publisher>Example</publisher>
+  <publicationYear>2015</publicationYear>
+</resource>
+"""
+
+class HarvestTestCase(LocalEZIDTestCase):
+
+    def setUp(self):
+        LocalEZIDTestCase.setUp(self)
+        (fd, self.path) = tempfile.mkstemp(suffix='.anvl.gz')
+        os.close(fd)
+        return
+
+    def tearDown(self):
+        os.unlink(self.path)
+        LocalEZIDTestCase.tearDown(self)
+        return
+
+    def add(self, identifier, datacite, updated=None):
+        if updated is None:
+            updated = time.time()
+        self.local_ezid.records[identifier] = ('http://example.org/',
+                                               datacite,
+                                               updated)
+        return
+
+    def test_harvest(self):
+        identifier = ezid.mint(landing_page='http://example.org/a',
+                               metadata=metadata,
+                               doi_prefix=ezid.test_prefix,
+                               auth=auth)
+        records = list(Harvester(auth, poll_interval=0).harvest(self.path))
+        self.assertEqual(len(records), 1)
+        (harvested, landing_page, md) = records[0]
+        self.assertEqual(harvested, identifier)
+        self.assertEqual(landing_page, 'http://example.org/a')
+        self.assertEqual(md, ezid.DOI(identifier).copy_metadata())
+        return
+
+    def test_missing_optional_elements(self):
+        self.add('10.5072/FK2MIN', minimal_xml)
+        records = list(Harvester(auth, poll_interval=0).harvest(self.path))
+        md = records[0][2]
+        self.assertEqual(md['title'], 'Minimal')
+        self.assertEqual(md['creators'], [('Doe, Jane', None)])
+        self.assertEqual(md['subjects'], [])
+        self.assertEqual(md['dates'], [])
+        self.assertEqual(md['version'], '')
+        self.assertEqual(set(md), set(ezid.metadata_values))
+        return
+
+    def test_bad_record_is_skipped(self):
+        self.add('10.5072/FK2MIN', minimal_xml)
+        self.add('10.5072/FK2BAD', '<resource><title>')
+        harvester = Harvester(auth, poll_interval=0)
+        records = list(harvester.harvest(self.path))
+        self.assertEqual([ r[0] for r in records ], ['10.5072/FK2MIN'])
+        self.assertEqual(len(harvester.errors), 1)
+        self.assertEqual(harvester.errors[0][0], '10.5072/FK2BAD')
+        return
+
+    def test_updated_after(self):
+        self.add('10.5072/FK2OLD', minimal_xml, updated=1000)
+        self.add('10.5072/FK2NEW', minimal_xml, updated=3000)
+        harvester = Harvester(auth, updated_after=2000, poll_interval=0)
+        records = list(harvester.harvest(self.path))
+        self.assertEqual([ r[0] for r in records ], ['10.5072/FK2NEW'])
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
@@ -0,0 +1,150 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+from ezid.history import HistoryStore
+from ezid.canonical import canonical_metadata
+from support import metadata
+
+def version_metadata(i):
+    md = dict(metadata, title='Title %d' % i)
+    if i % 2:
+        md['version'] = str(i)
+    return md
+
+class HistoryStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.history = HistoryStore(':memory:', snapshot_interval=5)
+        return
+
+    def tearDown(self):
+        self.history.close()
+        return
+
+    def record_versions(self, identifier, n, t0=1000):
+        for i in xrange(n):
+            version = self.history.record(identifier,
+                                          'http://example.org/%d' % i,
+                                          version_metadata(i),
+                                          timestamp=t0 + i)
+            self.assertEqual(version, i + 1)
+        return
+
+    def assertVersion(self, identifier, version, i):
+        (landing_page, md, t) = self.history.get(identifier, version)
+        self.assertEqual(landing_page, 'http://example.org/%d' % i)
+        self.assertEqual(canonical_metadata(md),
+                         canonical_metadata(version_metadata(i)))
+        return
+
+    def test_deltas(self):
+        self.record_versions('10.5072/A', 2)
+        # nothing changed
+        self.assertEqual(self.history.record('10.5072/A',
+                                             'http://example.org/1',
+                                             version_metadata(1)),
+                         None)
+        self.history.record('10.5072/A',
+                            'http://example.org/1',
+                            version_metadata(2))
+        query = 'SELECT delta FROM versions WHERE identifier = ? ' + \
+                'ORDER BY version'
+        deltas = [ json.loads(delta) for (delta, ) in
+                   self.history.db.execute(query, ('10.5072/A', )) ]
+        self.assertEqual(len(deltas), 3)
+        self.assertEqual(deltas[1], {'set': {'_target':
+                                             'http://example.org/1',
+                                             'title': 'Title 1',
+                                             'version': '1'},
+                                     'unset': []})
+        self.assertEqual(deltas[2], {'set': {'title': 'Title 2'},
+                                     'unset': ['version']})
+        return
+
+    def test_versions(self):
+        self.record_versions('10.5072/A', 12)
+        self.record_versions('10.5072/B', 3)
+        self.assertEqual(self.history.versions('10.5072/A'),
+                         [ (i + 1, 1000 + i) for i in xrange(12) ])
+        for i in xrange(12):
+            self.assertVersion('10.5072/A', i + 1, i)
+        self.assertVersion('10.5072/A', None, 11)
+        self.assertVersion('10.5072/B', None, 2)
+        self.assertRaises(KeyError, self.history.get, '10.5072/A', 13)
+        self.assertRaises(KeyError, self.history.get, '10.5072/C')
+        return
+
+    def test_snapshots(self):
+        self.record_versions('10.5072/A', 12)
+        query = 'SELECT version FROM snapshots WHERE identifier = ?'
+        self.assertEqual(self.history.db.execute(query,
+                                                 ('10.5072/A', )).fetchall(),
+                         [(5, ), (10, )])
+        # versions after a snapshot are rebuilt from it, without the
+        # deltas before it
+        with self.history.db:
+            self.history.db.execute('UPDATE versions SET delta = ? '
+                                    'WHERE version <= 10',
+                                    (json.dumps({'set': {}, 'unset': []}), ))
+        self.assertVersion('10.5072/A', 10, 9)
+        self.assertVersion('10.5072/A', 12, 11)
+        return
+
+    def test_changes_since(self):
+        # versions of different identifiers recorded at the same times
+        self.record_versions('10.5072/B', 7)
+        self.record_versions('10.5072/A', 7)
+        expected = []
+        for i in xrange(3, 7):
+            for identifier in ('10.5072/A', '10.5072/B'):
+                changes = {'_target': 'http://example.org/%d' % i,
+                           'title': 'Title %d' % i,
+                           'version': str(i) if i % 2 else None}
+                expected.append((identifier, i + 1, 1000.0 + i, changes))
+        for page_size in (1, 3, 1000):
+            self.assertEqual(list(self.history.changes_since(1002,
+                                                             page_size)),
+                             expected)
+        self.assertEqual(list(self.history.changes_since(1006)), [])
+        return
+
+    def test_record_during_scan(self):
+        self.record_versions('10.5072/A', 4)
+        scan = self.history.changes_since(0, page_size=2)
+        scan.next()
+        thread = threading.Thread(target=self.record_versions,
+                                  args=('10.5072/B', 2, 2000))
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([ (identifier, version)
+                           for (identifier, version, t, c) in scan ],
+                         [('10.5072/A', 2),
+                          ('10.5072/A', 3),
+                          ('10.5072/A', 4),
+                          ('10.5072/B', 1),
+                          ('10.5072/B', 2)])
+        return
+
+    def test_file(self):
+        self.history.close()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'history.db')
+            self.history = HistoryStore(path)
+            self.record_versions('10.5072/A', 2)
+            self.history.close()
+            self.history = HistoryStore(path)
+            self.assertVersion('10.5072/A', None, 1)
+            self.assertEqual(len(list(self.history.changes_since(0))), 2)
+        finally:
+            shutil.rmtree(tmpdir)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
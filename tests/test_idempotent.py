@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import ezid
+from ezid.idempotent import IdempotentMinter
+from ezid.canonical import record_hash
+from support import LocalEZIDTestCase, auth, metadata
+
+landing_page = 'http://example.org/a'
+
+class IdempotentMinterTestCase(LocalEZIDTestCase):
+
+    latency = 0.01
+
+    def setUp(self):
+        LocalEZIDTestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'mints.db')
+        self.minters = []
+        return
+
+    def tearDown(self):
+        for minter in self.minters:
+            minter.close()
+        shutil.rmtree(self.dir)
+        LocalEZIDTestCase.tearDown(self)
+        return
+
+    def minter(self):
+        # each minter has its own connection and in-flight set, as a
+        # minter in another process would
+        minter = IdempotentMinter(self.path, ezid.test_prefix, auth)
+        self.minters.append(minter)
+        return minter
+
+    def test_mint_once(self):
+        minter = self.minter()
+        identifier = minter.mint(landing_page, metadata)
+        self.assertEqual(minter.mint(landing_page, metadata), identifier)
+        self.assertEqual(self.minter().mint(landing_page, metadata),
+                         identifier)
+        self.assertEqual(self.local_ezid.n_minted, 1)
+        return
+
+    def test_lost_insert_returns_identifier(self):
+        identifier = self.minter().mint(landing_page, metadata)
+        minter = self.minter()
+        # the other process records the key between _get() and the insert
+        get = minter._get
+        results = [None]
+        minter._get = lambda key: results.pop() if results else get(key)
+        self.assertEqual(minter.mint(landing_page, metadata), identifier)
+        self.assertEqual(self.local_ezid.n_minted, 1)
+        return
+
+    def test_lost_insert_to_pending_mint(self):
+        minter = self.minter()
+        key = record_hash(landing_page, ezid.validate_metadata(metadata))
+        with minter.db:
+            minter.db.execute('INSERT INTO mints VALUES (?, NULL, 0)',
+                              (key, ))
+        get = minter._get
+        results = [None]
+        minter._get = lambda key: results.pop() if results else get(key)
+        self.assertRaises(ezid.PendingMintError,
+                          minter.mint,
+                          landing_page,
+                          metadata)
+        self.assertEqual(self.local_ezid.n_minted, 0)
+        return
+
+    def test_concurrent_minters(self):
+        minters = [ self.minter() for i in xrange(4) ]
+        results = []
+        def mint(minter):
+            try:
+                results.append(minter.mint(landing_page, metadata))
+            except ezid.PendingMintError as exc:
+                results.append(exc)
+            except Exception as exc:
+                results.append(('unexpected', exc))
+        threads = [ threading.Thread(target=mint, args=(minters[i % 4], ))
+                    for i in xrange(16) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        identifiers = set( r for r in results if isinstance(r, basestring) )
+        others = [ r for r in results
+                   if not isinstance(r, (basestring, ezid.PendingMintError)) ]
+        self.assertEqual(others, [])
+        self.assertEqual(len(identifiers), 1)
+        self.assertEqual(self.local_ezid.n_minted, 1)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
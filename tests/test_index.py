@@ -0,0 +1,127 @@
+import unittest
+import time
+from ezid.index import MetadataIndex, metadata_terms, normalize
+
+def record(title, creators=(), related=(), alternate=()):
+    return {'title': title,
+            'creators': [ (name, None) for name in creators ],
+            'relatedidentifiers': [ (doi, 'DOI', 'IsPartOf')
+                                    for doi in related ],
+            'alternateidentifiers': list(alternate)}
+
+class NormalizeTestCase(unittest.TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize('  Caf\xc3\xa9  au-LAIT_ '), u'cafe au lait')
+        self.assertEqual(normalize(u'Na\xefve,\tdata!'), u'naive data')
+        return
+
+    def test_metadata_terms(self):
+        md = record('The Title.',
+                    creators=['Smith, John', 'John  Smith', ''],
+                    related=['10.5072/ABC '],
+                    alternate=[('Local ID', ' X1 ')])
+        self.assertEqual(metadata_terms(md),
+                         set([('title', u'the title'),
+                              ('creator', u'john smith'),
+                              ('relatedidentifier', '10.5072/abc'),
+                              ('alternateidentifier', u'local id x1')]))
+        return
+
+class MetadataIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = MetadataIndex(':memory:')
+        return
+
+    def tearDown(self):
+        self.index.close()
+        return
+
+    def test_add_and_remove(self):
+        self.index.add('doi:A', record('One', ['Doe, Jane']))
+        self.index.add_many([('doi:B', None, record('Two')),
+                             ('doi:C', None, None)])
+        self.assertEqual(len(self.index), 2)
+        # adding again replaces the entry
+        self.index.add('doi:A', record('Three'))
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.duplicates(record('One', ['Doe, Jane'])),
+                         [])
+        self.index.remove('doi:A')
+        self.assertEqual(len(self.index), 1)
+        return
+
+    def test_scores(self):
+        self.index.add('doi:A', record('Same title', ['Doe, Jane']))
+        self.index.add('doi:B', record('Same title', ['Roe, Richard']))
+        self.index.add('doi:C', record('Other', ['Jane Doe'],
+                                       alternate=[('local', 'x1')]))
+        self.index.add('doi:D', record('Other', ['Doe, Jane']))
+        md = record('Same Title!', ['Doe, Jane'], alternate=[('Local', 'X1')])
+        self.assertEqual(self.index.duplicates(md),
+                         [('doi:C', 5), ('doi:A', 3)])
+        self.assertEqual(self.index.duplicates(md, min_score=1),
+                         [('doi:C', 5),
+                          ('doi:A', 3),
+                          ('doi:B', 2),
+                          ('doi:D', 1)])
+        self.assertEqual(self.index.duplicates(md, exclude='doi:C'),
+                         [('doi:A', 3)])
+        self.assertEqual(self.index.duplicates({}), [])
+        return
+
+    def test_common_terms(self):
+        # every record is part of one collection and has one creator in
+        # common
+        self.index.add_many( ('doi:%d' % i,
+                              None,
+                              record('Dataset %d' % i,
+                                     ['Common, Author'],
+                                     related=['10.5072/COLLECTION']))
+                             for i in xrange(50) )
+        md = record('Dataset 7',
+                    ['Common, Author'],
+                    related=['10.5072/COLLECTION'])
+        # common terms still count toward candidates' scores
+        self.assertEqual(self.index.duplicates(md, max_postings=10),
+                         [('doi:7', 4)])
+        self.assertEqual(self.index.duplicates(md, min_score=2)[:2],
+                         [('doi:7', 4), ('doi:0', 2)])
+        # but do not make records candidates
+        md['title'] = 'Something else'
+        self.assertEqual(self.index.duplicates(md,
+                                               min_score=1,
+                                               max_postings=10),
+                         [])
+        return
+
+    def test_common_terms_are_cheap(self):
+        # a query whose common terms are found in every record takes
+        # no longer than one without them
+        self.index.add_many( ('doi:%d' % i,
+                              None,
+                              record('Dataset %d' % i,
+                                     ['Common, Author'],
+                                     related=['10.5072/COLLECTION']))
+                             for i in xrange(20000) )
+        def timed(md, expected):
+            t0 = time.time()
+            for i in xrange(20):
+                self.assertEqual(self.index.duplicates(md,
+                                                       min_score=1,
+                                                       max_postings=100),
+                                 expected)
+            return time.time() - t0
+        plain = timed(record('Dataset 7'), [('doi:7', 2)])
+        common = timed(record('Dataset 7',
+                              ['Common, Author'],
+                              related=['10.5072/COLLECTION']),
+                       [('doi:7', 4)])
+        self.assertTrue(common < plain * 10 + 0.05, (common, plain))
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
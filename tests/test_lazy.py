@@ -0,0 +1,120 @@
+import unittest
+import gc
+import time
+import copy
+import xml.dom.minidom
+import ezid
+from support import LocalEZIDTestCase, auth, metadata
+
+def datacite(metadata):
+    xml = ezid.create_datacite_xml('10.5072/FK2TEST', metadata)
+    return xml.encode('utf-8')
+
+def reachable_nodes(obj):
+    """return the DOM nodes reachable from obj"""
+    nodes = []
+    seen = set()
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        if isinstance(o, xml.dom.minidom.Node):
+            nodes.append(o)
+        # modules and classes lead everywhere
+        if isinstance(o, (type, type(ezid), type(unittest.TestCase))):
+            continue
+        stack.extend(gc.get_referents(o))
+    return nodes
+
+class LazyMetadataTestCase(LocalEZIDTestCase):
+
+    def setUp(self):
+        LocalEZIDTestCase.setUp(self)
+        self.identifier = ezid.mint('http://example.org/a',
+                                    metadata,
+                                    ezid.test_prefix,
+                                    auth)
+        return
+
+    def test_partial_read_keeps_no_dom(self):
+        md = ezid.DOI(self.identifier).metadata
+        self.assertIsInstance(md, ezid.LazyMetadata)
+        self.assertEqual(md['title'], 'Test dataset')
+        self.assertEqual(reachable_nodes(md), [])
+        return
+
+    def test_same_as_xml_to_metadata(self):
+        doi = ezid.DOI(self.identifier)
+        self.assertEqual(dict(doi.metadata), ezid.xml_to_metadata(doi.xml))
+        return
+
+    def test_set_before_read(self):
+        md = ezid.DOI(self.identifier).metadata
+        md['title'] = 'New title'
+        del md['version']
+        self.assertEqual(md['title'], 'New title')
+        self.assertNotIn('version', md)
+        self.assertEqual(md['publisher'], 'Example University')
+        return
+
+    def test_deepcopy(self):
+        md = ezid.DOI(self.identifier).metadata
+        md['title']
+        md2 = copy.deepcopy(md)
+        self.assertEqual(dict(md2), dict(md))
+        return
+
+class DecodingTestCase(unittest.TestCase):
+
+    def test_fields_decoded_when_read(self):
+        md = ezid.LazyMetadata(datacite(metadata))
+        self.assertEqual(md['title'], 'Test dataset')
+        self.assertEqual(md._values.keys(), ['title'])
+        return
+
+    def test_other_fields_not_parsed(self):
+        # a bad publisher element does not stop the title being read
+        xml = datacite(metadata).replace('<publisher>',
+                                         '<publisher/><publisher>')
+        md = ezid.LazyMetadata(xml)
+        self.assertEqual(md['title'], 'Test dataset')
+        self.assertRaises(AssertionError, md.__getitem__, 'publisher')
+        return
+
+    def test_awkward_xml(self):
+        xml = datacite(dict(metadata, formats=['a', 'b']))
+        variants = [xml.replace('<titles>',
+                                '<!-- <title>x</title> --><titles>'),
+                    xml.replace('<formats>', '<formats >'),
+                    xml.replace('<version/>', ''),
+                    xml.replace('Test dataset', '<![CDATA[Test dataset]]>'),
+                    xml.replace('<?xml version="1.0" ?>',
+                                '<?xml version="1.0" encoding="latin-1"?>')]
+        for variant in variants:
+            self.assertNotEqual(variant, xml)
+            md = ezid.LazyMetadata(variant)
+            self.assertEqual(dict(md), ezid.xml_to_metadata(variant))
+        return
+
+    def test_partial_read_is_cheaper(self):
+        md = dict(metadata,
+                  descriptions=[('Abstract', 'word ' * 50)] * 2000)
+        xml = datacite(md)
+        t0 = time.time()
+        for i in xrange(5):
+            ezid.xml_to_metadata(xml)
+        full = time.time() - t0
+        t0 = time.time()
+        for i in xrange(5):
+            md = ezid.LazyMetadata(xml)
+            (md['title'], md['creators'])
+        partial = time.time() - t0
+        self.assertTrue(partial * 10 < full, (partial, full))
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
@@ -0,0 +1,28 @@
+import unittest
+from ezid import membench
+
+class MembenchTestCase(unittest.TestCase):
+
+    def test_budgets(self):
+        # the jobs that keep their records; export and harvest keep
+        # nothing, so their fixed costs dominate small runs
+        results = membench.run(500, ['load', 'listing', 'parse'])
+        self.assertEqual([ r.name for r in results ],
+                         ['load', 'listing', 'parse'])
+        self.assertEqual(membench.check(results), [])
+        for result in results:
+            self.assertTrue(result.steady > 0)
+            self.assertTrue(result.peak >= result.steady)
+        return
+
+    def test_budget_failure(self):
+        results = membench.run(50, ['load'])
+        failures = membench.check(results, {'load': (1, None)})
+        self.assertEqual(len(failures), 1)
+        self.assertTrue(failures[0].startswith('load: peak'))
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
@@ -0,0 +1,51 @@
+import unittest
+import os
+import shutil
+import tempfile
+import ezid
+from ezid.idempotent import IdempotentMinter
+from support import LocalEZIDTestCase, auth, metadata
+
+class MintDOITestCase(LocalEZIDTestCase):
+
+    def assertSameAsLoaded(self, doi):
+        loaded = ezid.DOI(doi.identifier)
+        # built from the metadata given, not parsed from XML
+        self.assertIs(type(doi.metadata), dict)
+        self.assertEqual(sorted(doi.metadata), sorted(loaded.metadata))
+        self.assertEqual(dict(doi.metadata), dict(loaded.metadata))
+        self.assertEqual(doi.landing_page, loaded.landing_page)
+        return
+
+    def test_mint_doi(self):
+        n_posts = self.handler.counts.get('POST', 0)
+        doi = ezid.mint_doi('http://example.org/a',
+                            metadata,
+                            ezid.test_prefix,
+                            auth)
+        self.assertEqual(self.handler.counts.get('POST', 0), n_posts + 1)
+        self.assertEqual(self.handler.counts.get('GET', 0), 0)
+        self.assertSameAsLoaded(doi)
+        return
+
+    def test_idempotent_mint_doi(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            minter = IdempotentMinter(os.path.join(tmpdir, 'mints.db'),
+                                      ezid.test_prefix,
+                                      auth)
+            doi = minter.mint_doi('http://example.org/a', metadata)
+            self.assertEqual(self.handler.counts.get('GET', 0), 0)
+            self.assertSameAsLoaded(doi)
+            again = minter.mint_doi('http://example.org/a', metadata)
+            self.assertEqual(again.identifier, doi.identifier)
+            self.assertSameAsLoaded(again)
+            minter.close()
+        finally:
+            shutil.rmtree(tmpdir)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
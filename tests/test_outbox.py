@@ -0,0 +1,67 @@
+import unittest
+import ezid
+from ezid.outbox import Outbox
+from ezid.history import HistoryStore
+from ezid.canonical import canonical_metadata
+from support import LocalEZIDTestCase, auth, metadata
+
+class OutboxTestCase(LocalEZIDTestCase):
+
+    def setUp(self):
+        LocalEZIDTestCase.setUp(self)
+        self.identifier = ezid.mint('http://example.org/a',
+                                    metadata,
+                                    ezid.test_prefix,
+                                    auth)
+        self.outbox = Outbox(':memory:')
+        self.history = HistoryStore(':memory:')
+        ezid.observers.append(self.history.observe)
+        return
+
+    def tearDown(self):
+        self.outbox.close()
+        self.history.close()
+        LocalEZIDTestCase.tearDown(self)
+        return
+
+    def assertHistoryMatchesEZID(self):
+        doi = ezid.DOI(self.identifier)
+        (landing_page, md, t) = self.history.get(self.identifier)
+        self.assertEqual(landing_page, doi.landing_page)
+        self.assertEqual(canonical_metadata(md),
+                         canonical_metadata(doi.copy_metadata()))
+        return
+
+    def test_landing_page_flush_notifies(self):
+        self.outbox.update_landing_page(self.identifier, 'http://z')
+        self.assertEqual(self.outbox.flush(auth), (1, 0))
+        self.assertHistoryMatchesEZID()
+        self.assertEqual(self.history.get(self.identifier)[0], 'http://z')
+        return
+
+    def test_metadata_flush_notifies(self):
+        self.outbox.update_metadata(self.identifier,
+                                    dict(metadata, title='New title'))
+        self.assertEqual(self.outbox.flush(auth), (1, 0))
+        self.assertHistoryMatchesEZID()
+        (landing_page, md, t) = self.history.get(self.identifier)
+        self.assertEqual(landing_page, 'http://example.org/a')
+        self.assertEqual(md['title'], 'New title')
+        return
+
+    def test_merged_flush_notifies_once(self):
+        self.outbox.update_landing_page(self.identifier, 'http://z')
+        self.outbox.update_metadata(self.identifier,
+                                    dict(metadata, title='New title'))
+        n_gets = self.handler.counts.get('GET', 0)
+        self.assertEqual(self.outbox.flush(auth), (1, 0))
+        # both fields were sent, so nothing is read back
+        self.assertEqual(self.handler.counts.get('GET', 0), n_gets)
+        self.assertEqual(len(self.history.versions(self.identifier)), 1)
+        self.assertHistoryMatchesEZID()
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
@@ -0,0 +1,70 @@
+import unittest
+import StringIO
+import ezid
+from ezid.stream import iter_resources
+from support import metadata
+
+def resource(identifier, md):
+    xml = ezid.create_datacite_xml(identifier, md).encode('utf-8')
+    # drop the XML declaration so resources can be wrapped
+    return xml[xml.index('<resource'):]
+
+def document(resources):
+    return StringIO.StringIO('<?xml version="1.0"?>\n<records><wrapper>' +
+                             ''.join(resources) +
+                             '</wrapper></records>')
+
+class IterResourcesTestCase(unittest.TestCase):
+
+    def test_same_as_xml_to_metadata(self):
+        mds = [ dict(metadata, title='Title %d' % i) for i in xrange(3) ]
+        mds[1]['formats'] = ['a', 'b']
+        xmls = [ resource('10.5072/FK2%d' % i, md)
+                 for (i, md) in enumerate(mds) ]
+        records = list(iter_resources(document(xmls)))
+        self.assertEqual([ identifier for (identifier, md) in records ],
+                         ['10.5072/FK2%d' % i for i in xrange(3)])
+        for ((identifier, md), xml) in zip(records, xmls):
+            self.assertEqual(md, ezid.xml_to_metadata(xml))
+        return
+
+    def test_missing_elements(self):
+        # keys whose element is missing have empty values, as from
+        # xml_to_metadata()
+        xml = resource('10.5072/FK2A', metadata).replace('<version/>', '')
+        self.assertNotIn('<version', xml)
+        [(identifier, md)] = list(iter_resources(document([xml])))
+        self.assertEqual(sorted(md), sorted(ezid.metadata_values))
+        self.assertEqual(md['version'], ezid.xml_to_metadata(xml)['version'])
+        return
+
+    def test_no_identifier(self):
+        xml = resource(None, metadata).replace(
+            '<identifier identifierType="DOI">(:tba)</identifier>', '')
+        self.assertNotIn('<identifier', xml)
+        self.assertEqual(list(iter_resources(document([xml])))[0][0], None)
+        return
+
+    def test_on_error(self):
+        good = resource('10.5072/FK2A', metadata)
+        bad = resource('10.5072/FK2B', metadata).replace('<publisher>',
+                                                          '<publisher/>'
+                                                          '<publisher>')
+        source = document([good, bad, good])
+        self.assertRaises(AssertionError, list, iter_resources(source))
+        errors = []
+        source.seek(0)
+        records = list(iter_resources(source,
+                                      on_error=lambda *args:
+                                               errors.append(args)))
+        self.assertEqual([ identifier for (identifier, md) in records ],
+                         ['10.5072/FK2A', '10.5072/FK2A'])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0][0], '10.5072/FK2B')
+        self.assertIsInstance(errors[0][1], AssertionError)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
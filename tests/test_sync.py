@@ -0,0 +1,160 @@
+import unittest
+import ezid
+from ezid import sync
+from ezid.canonical import canonical_metadata
+from support import LocalEZIDTestCase, auth, metadata
+
+class PlanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.state = sync.StateCache(':memory:')
+        self.state.put('10.5072/A', 'http://example.org/a', metadata)
+        return
+
+    def tearDown(self):
+        self.state.close()
+        return
+
+    def plan(self, *entries):
+        return [ (a.kind, a.identifier, a.changed)
+                 for a in sync.plan(entries, self.state) ]
+
+    def test_kinds(self):
+        md = dict(metadata, title='New title')
+        self.assertEqual(self.plan(('10.5072/A', 'http://example.org/a',
+                                    metadata),
+                                   ('10.5072/A', 'http://example.org/b',
+                                    metadata),
+                                   ('10.5072/A', 'http://example.org/a', md),
+                                   ('10.5072/A', 'http://example.org/b', md)),
+                         [(sync.NOOP, '10.5072/A', []),
+                          (sync.UPDATE_TARGET, '10.5072/A', ['_target']),
+                          (sync.UPDATE_METADATA, '10.5072/A', ['title']),
+                          (sync.UPDATE, '10.5072/A', ['_target', 'title'])])
+        return
+
+    def test_same_record_in_other_forms(self):
+        # the form xml_to_metadata() returns plans no write
+        xml = ezid.create_datacite_xml('10.5072/A',
+                                       ezid.validate_metadata(metadata))
+        md = ezid.xml_to_metadata(xml)
+        self.assertEqual(self.plan(('10.5072/A', 'http://example.org/a', md)),
+                         [(sync.NOOP, '10.5072/A', [])])
+        return
+
+    def test_creates(self):
+        actions = self.plan(('10.5072/B', 'http://example.org/b', metadata),
+                            (None, 'http://example.org/c', metadata))
+        self.assertEqual([ a[:2] for a in actions ],
+                         [(sync.CREATE, '10.5072/B'), (sync.CREATE, None)])
+        self.assertIn('_target', actions[0][2])
+        self.assertIn('title', actions[0][2])
+        return
+
+    def test_invalid_metadata(self):
+        md = dict(metadata, publicationyear='soon')
+        self.assertRaises(ValueError,
+                          self.plan,
+                          ('10.5072/A', 'http://example.org/a', md))
+        return
+
+class ExecuteTestCase(LocalEZIDTestCase):
+
+    def setUp(self):
+        LocalEZIDTestCase.setUp(self)
+        self.state = sync.StateCache(':memory:')
+        return
+
+    def tearDown(self):
+        self.state.close()
+        LocalEZIDTestCase.tearDown(self)
+        return
+
+    def assertRemote(self, identifier, landing_page, md):
+        (remote_landing_page, datacite, t) = \
+            self.local_ezid.records[identifier]
+        self.assertEqual(remote_landing_page, landing_page)
+        self.assertEqual(canonical_metadata(ezid.xml_to_metadata(datacite)),
+                         canonical_metadata(md))
+        # and the state knows it, so nothing more is planned
+        [action] = sync.plan([(identifier, landing_page, md)], self.state)
+        self.assertEqual(action.kind, sync.NOOP)
+        return
+
+    def test_execute(self):
+        identifier = ezid.mint('http://example.org/a',
+                               metadata,
+                               ezid.test_prefix,
+                               auth)
+        self.state.put(identifier, 'http://example.org/a', metadata)
+        md = dict(metadata, title='New title')
+        entries = [(identifier, 'http://example.org/b', md),
+                   ('10.5072/FK2NEW', 'http://example.org/new', metadata),
+                   (None, 'http://example.org/minted', metadata)]
+        actions = list(sync.plan(entries, self.state))
+        results = list(sync.execute(actions,
+                                    auth,
+                                    self.state,
+                                    doi_prefix=ezid.test_prefix))
+        self.assertEqual(len(results), 3)
+        identifiers = {}
+        for (action, result, error) in results:
+            self.assertEqual(error, None)
+            identifiers[action.landing_page] = result
+        self.assertEqual(identifiers['http://example.org/b'], identifier)
+        self.assertEqual(identifiers['http://example.org/new'],
+                         '10.5072/FK2NEW')
+        self.assertRemote(identifier, 'http://example.org/b', md)
+        self.assertRemote('10.5072/FK2NEW', 'http://example.org/new', metadata)
+        self.assertRemote(identifiers['http://example.org/minted'],
+                          'http://example.org/minted',
+                          metadata)
+        return
+
+    def test_create_existing(self):
+        identifier = ezid.mint('http://example.org/a',
+                               metadata,
+                               ezid.test_prefix,
+                               auth)
+        # not in the state, so planned as a create
+        md = dict(metadata, title='New title')
+        actions = list(sync.plan([(identifier, 'http://example.org/b', md)],
+                                 self.state))
+        self.assertEqual(actions[0].kind, sync.CREATE)
+        counts = sync.sync(actions, auth, self.state)
+        self.assertEqual(counts, {sync.CREATE: 1})
+        self.assertRemote(identifier, 'http://example.org/b', md)
+        return
+
+    def test_counts(self):
+        identifier = ezid.mint('http://example.org/a',
+                               metadata,
+                               ezid.test_prefix,
+                               auth)
+        self.state.put(identifier, 'http://example.org/a', metadata)
+        entries = [(identifier, 'http://example.org/a', metadata),
+                   (identifier, 'http://example.org/b', metadata),
+                   ('10.5072/FK2NEW', 'http://example.org/new', metadata),
+                   # no prefix or minter to mint with
+                   (None, 'http://example.org/minted', metadata),
+                   # not in EZID
+                   ('10.5072/FK2MISSING', 'http://example.org/m', metadata)]
+        self.state.put('10.5072/FK2MISSING', 'http://example.org/', metadata)
+        progress = []
+        counts = sync.sync(sync.plan(entries, self.state),
+                           auth,
+                           self.state,
+                           progress=lambda *args: progress.append(args))
+        # failed writes are counted only as errors
+        self.assertEqual(counts, {sync.NOOP: 1,
+                                  sync.UPDATE_TARGET: 1,
+                                  sync.CREATE: 1,
+                                  'error': 2})
+        self.assertEqual(len(progress), 4)
+        self.assertEqual(progress[-1][0].count, 4)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
@@ -0,0 +1,179 @@
+import unittest
+import random
+import time
+import threading
+import ezid
+from ezid import connection
+from ezid.transport import LocalTransport
+from ezid.canonical import canonical_metadata
+from support import LocalEZIDTestCase, auth, metadata
+
+n_threads = 32
+n_operations = 20
+
+class SlowGets:
+
+    """passes requests to handler, holding GETs for delay seconds;
+    started is set when a GET arrives"""
+
+    def __init__(self, handler, delay):
+        self.handler = handler
+        self.delay = delay
+        self.started = threading.Event()
+        return
+
+    def __call__(self, method, url, headers, data, auth):
+        if method == 'GET':
+            # the record is read before the delay, as a slow reply would be
+            reply = self.handler(method, url, headers, data, auth)
+            self.started.set()
+            time.sleep(self.delay)
+            return reply
+        return self.handler(method, url, headers, data, auth)
+
+class ThreadsTestCase(LocalEZIDTestCase):
+
+    latency = 0.01
+
+    def mint(self, name):
+        return ezid.mint('http://example.org/%s' % name,
+                         metadata,
+                         ezid.test_prefix,
+                         auth)
+
+    def run_threads(self, target, n):
+        errors = []
+        def run(i):
+            try:
+                target(i)
+            except Exception as exc:
+                errors.append(exc)
+            return
+        threads = [ threading.Thread(target=run, args=(i, ))
+                    for i in xrange(n) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return
+
+    def assertServerState(self, doi):
+        (landing_page, datacite, t) = self.local_ezid.records[doi.identifier]
+        self.assertEqual(landing_page, doi.landing_page)
+        self.assertEqual(canonical_metadata(ezid.xml_to_metadata(datacite)),
+                         canonical_metadata(doi.copy_metadata()))
+        return
+
+    def assertNothingLeftOver(self):
+        self.assertEqual(ezid._identifiers, {})
+        return
+
+    def test_mixed_operations(self):
+        # one DOI object shared by every thread, and one of its own for
+        # each thread
+        shared = ezid.DOI(self.mint('shared'))
+        distinct = [ ezid.DOI(self.mint('distinct%d' % i))
+                     for i in xrange(n_threads) ]
+        # identifier -> landing pages written
+        written = dict( (doi.identifier, set([doi.landing_page]))
+                        for doi in [shared] + distinct )
+        def operate(i):
+            rng = random.Random(i)
+            for j in xrange(n_operations):
+                doi = rng.choice((shared, distinct[i]))
+                op = rng.choice(('landing_page', 'metadata', 'load'))
+                if op == 'landing_page':
+                    landing_page = 'http://example.org/%d/%d' % (i, j)
+                    written[doi.identifier].add(landing_page)
+                    doi.update_landing_page(landing_page, auth)
+                elif op == 'metadata':
+                    md = dict(metadata, title='Title %d/%d' % (i, j))
+                    doi.update_metadata(md, auth)
+                else:
+                    loaded = ezid.DOI(doi.identifier)
+                    self.assertIn(loaded.landing_page,
+                                  written[doi.identifier])
+                    self.assertEqual(loaded.metadata['publisher'],
+                                     metadata['publisher'])
+            return
+        self.run_threads(operate, n_threads)
+        self.assertServerState(shared)
+        for doi in distinct:
+            self.assertServerState(doi)
+        self.assertNothingLeftOver()
+        return
+
+    def test_simultaneous_loads_share_one_request(self):
+        identifier = self.mint('shared')
+        # long enough for every thread to join the first load
+        self.local_ezid.latency = 0.2
+        n_gets = self.handler.counts.get('GET', 0)
+        start = threading.Event()
+        dois = [None] * 50
+        def load(i):
+            start.wait()
+            dois[i] = ezid.DOI(identifier)
+            return
+        threads = [ threading.Thread(target=load, args=(i, ))
+                    for i in xrange(len(dois)) ]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.handler.counts.get('GET', 0), n_gets + 1)
+        for doi in dois:
+            self.assertEqual(doi.landing_page, 'http://example.org/shared')
+            self.assertEqual(doi.metadata['title'], metadata['title'])
+        self.assertNothingLeftOver()
+        return
+
+class LoadDuringWriteTestCase(LocalEZIDTestCase):
+
+    def setUp(self):
+        LocalEZIDTestCase.setUp(self)
+        self.identifier = ezid.mint('http://example.org/old',
+                                    metadata,
+                                    ezid.test_prefix,
+                                    auth)
+        self.slow = SlowGets(self.handler, 0.3)
+        connection.transport = LocalTransport(self.slow)
+        return
+
+    def start_load(self, load):
+        thread = threading.Thread(target=load)
+        thread.start()
+        self.slow.started.wait()
+        return thread
+
+    def test_read_own_write(self):
+        doi = ezid.DOI(self.identifier)
+        self.slow.started.clear()
+        thread = self.start_load(lambda: ezid.DOI(self.identifier))
+        doi.update_landing_page('http://example.org/new', auth)
+        # the load in progress started before the write, so it is not
+        # shared
+        loaded = ezid.DOI(self.identifier)
+        self.assertEqual(loaded.landing_page, 'http://example.org/new')
+        thread.join()
+        return
+
+    def test_load_does_not_undo_write(self):
+        shared = ezid.DOI(self.identifier)
+        self.slow.started.clear()
+        thread = self.start_load(shared.load)
+        shared.update_metadata(dict(metadata, title='NEW TITLE'), auth)
+        thread.join()
+        self.assertEqual(shared.metadata['title'], 'NEW TITLE')
+        shared.update_landing_page('http://example.org/new', auth)
+        (landing_page, datacite, t) = self.local_ezid.records[self.identifier]
+        self.assertEqual(landing_page, 'http://example.org/new')
+        self.assertEqual(ezid.xml_to_metadata(datacite)['title'], 'NEW TITLE')
+        self.assertEqual(ezid._identifiers, {})
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
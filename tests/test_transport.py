@@ -0,0 +1,350 @@
+import gzip
+import socket
+import StringIO
+import threading
+import time
+import unittest
+import BaseHTTPServer
+import SocketServer
+import ezid
+from ezid import connection
+from ezid.transport import RequestsTransport, HTTP2Transport
+
+try:
+    import h2.connection
+    import h2.events
+    import hyper
+except ImportError:
+    hyper = None
+
+big_body = ''.join( '%07d\n' % i for i in xrange(200000) )
+
+def gzipped(data):
+    buf = StringIO.StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb')
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+def respond(path, headers):
+    """return (status, headers, body, delay) for a test request"""
+    if path == '/slow':
+        return (200, [], 'slow', 1.0)
+    if path == '/stall':
+        # the HTTP/2 server stalls after the first frame
+        return (200, [], big_body, 0)
+    if path == '/big':
+        return (200, [], big_body, 0)
+    if path == '/gzip':
+        if 'gzip' in headers.get('accept-encoding', ''):
+            return (200, [('content-encoding', 'gzip')], gzipped(big_body), 0)
+        return (200, [], big_body, 0)
+    return (200, [], 'hello %s' % path, 0)
+
+def join(headers):
+    """return a dictionary of headers, joining repeated ones"""
+    joined = {}
+    for (name, value) in headers:
+        if name in joined:
+            joined[name] += ', ' + value
+        else:
+            joined[name] = value
+    return joined
+
+class H2Server(threading.Thread):
+
+    """HTTP/2 (h2c, prior knowledge) server on 127.0.0.1 for the tests;
+    each stream is answered by a thread of its own"""
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.n_connections = 0
+        self.request_headers = []
+        return
+
+    def run(self):
+        while True:
+            try:
+                (sock, address) = self.sock.accept()
+            except socket.error:
+                return
+            self.n_connections += 1
+            t = threading.Thread(target=self.serve, args=(sock, ))
+            t.daemon = True
+            t.start()
+
+    def close(self):
+        self.sock.close()
+        return
+
+    def serve(self, sock):
+        conn = h2.connection.H2Connection(client_side=False,
+                                          header_encoding=None)
+        cond = threading.Condition()
+        conn.initiate_connection()
+        sock.sendall(conn.data_to_send())
+        requests = {}
+        while True:
+            try:
+                data = sock.recv(65536)
+            except socket.error:
+                break
+            if not data:
+                break
+            with cond:
+                events = conn.receive_data(data)
+                for event in events:
+                    if isinstance(event, h2.events.RequestReceived):
+                        requests[event.stream_id] = join(event.headers)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        headers = requests.pop(event.stream_id)
+                        self.request_headers.append(headers)
+                        t = threading.Thread(target=self.answer,
+                                             args=(sock,
+                                                   conn,
+                                                   cond,
+                                                   event.stream_id,
+                                                   headers))
+                        t.daemon = True
+                        t.start()
+                    elif isinstance(event, h2.events.WindowUpdated):
+                        cond.notify_all()
+                sock.sendall(conn.data_to_send())
+        sock.close()
+        return
+
+    def answer(self, sock, conn, cond, stream_id, headers):
+        (status, extra, body, delay) = respond(headers[':path'], headers)
+        time.sleep(delay)
+        try:
+            with cond:
+                conn.send_headers(stream_id,
+                                  [(':status', str(status))] + extra)
+                while body:
+                    window = min(conn.local_flow_control_window(stream_id),
+                                 conn.max_outbound_frame_size)
+                    if window <= 0:
+                        sock.sendall(conn.data_to_send())
+                        cond.wait(1)
+                        continue
+                    conn.send_data(stream_id, body[:window])
+                    body = body[window:]
+                    if headers[':path'] == '/stall':
+                        sock.sendall(conn.data_to_send())
+                        cond.wait(1.0)
+                conn.end_stream(stream_id)
+                sock.sendall(conn.data_to_send())
+        except Exception:
+            # the client reset the stream
+            pass
+        return
+
+class HTTP1Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        headers = dict( (k.lower(), v) for (k, v) in self.headers.items() )
+        self.server.request_headers.append(headers)
+        if self.path in ('/drip', '/stall'):
+            return self.trickle()
+        (status, extra, body, delay) = respond(self.path, headers)
+        self.send_response(status)
+        for (name, value) in extra:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def trickle(self):
+        # /drip sends a byte every 0.2 seconds; /stall sends one and stops
+        self.send_response(200)
+        self.send_header('Content-Length', '100')
+        self.end_headers()
+        try:
+            for i in xrange(100):
+                self.wfile.write('x')
+                self.wfile.flush()
+                if self.path == '/stall':
+                    time.sleep(2)
+                    return
+                time.sleep(0.2)
+        except socket.error:
+            pass
+        return
+
+    def log_message(self, *args):
+        return
+
+class HTTP1Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients that give up close the connection
+        return
+
+class TransportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = connection.transport
+        for breaker in connection.breakers.itervalues():
+            breaker.reset()
+        return
+
+    def tearDown(self):
+        connection.transport = self.saved
+        return
+
+    def get(self, path, **kwargs):
+        return connection.request('ezid',
+                                  'load',
+                                  'GET',
+                                  self.url + path,
+                                  **kwargs)
+
+class RequestsTransportTestCase(TransportTestCase):
+
+    def setUp(self):
+        TransportTestCase.setUp(self)
+        self.server = HTTP1Server(('127.0.0.1', 0), HTTP1Handler)
+        self.server.request_headers = []
+        t = threading.Thread(target=self.server.serve_forever)
+        t.daemon = True
+        t.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        connection.transport = RequestsTransport()
+        return
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        TransportTestCase.tearDown(self)
+        return
+
+    def test_compression(self):
+        r = self.get('/gzip')
+        self.assertEqual(r.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(r.content, big_body)
+        accept = self.server.request_headers[-1]['accept-encoding']
+        self.assertEqual(accept, 'gzip, deflate')
+        return
+
+    def test_deadline_covers_body(self):
+        # every byte arrives inside the read timeout
+        t0 = time.time()
+        self.assertRaises(ezid.RequestTimeoutError,
+                          self.get,
+                          '/drip',
+                          timeout=(1, 1),
+                          deadline=0.5)
+        self.assertTrue(time.time() - t0 < 1.0)
+        return
+
+    def test_body_timeout(self):
+        self.assertRaises(ezid.RequestTimeoutError,
+                          self.get,
+                          '/stall',
+                          timeout=(1, 0.2))
+        return
+
+    def test_streamed_body_timeout(self):
+        r = self.get('/stall', timeout=(1, 0.2), stream=True)
+        self.assertRaises(ezid.RequestTimeoutError,
+                          list,
+                          r.iter_content(10))
+        r.close()
+        return
+
+@unittest.skipIf(hyper is None, 'hyper is not installed')
+class HTTP2TransportTestCase(TransportTestCase):
+
+    def setUp(self):
+        TransportTestCase.setUp(self)
+        self.server = H2Server()
+        self.server.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.port
+        self.transport = HTTP2Transport(prefixes=(self.url, ))
+        connection.transport = self.transport
+        return
+
+    def tearDown(self):
+        self.transport.adapter.close()
+        self.server.close()
+        TransportTestCase.tearDown(self)
+        return
+
+    def test_get(self):
+        r = self.get('/a')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.content, 'hello /a')
+        return
+
+    def test_threads_share_one_connection(self):
+        results = []
+        def get(i):
+            for j in xrange(5):
+                path = '/%d/%d' % (i, j)
+                results.append(self.get(path).content == 'hello ' + path)
+        threads = [ threading.Thread(target=get, args=(i, ))
+                    for i in xrange(16) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [True] * 80)
+        self.assertEqual(self.server.n_connections, 1)
+        return
+
+    def test_streaming(self):
+        r = self.get('/big', stream=True)
+        chunks = list(r.iter_content(64 * 1024))
+        r.close()
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(''.join(chunks), big_body)
+        return
+
+    def test_body_timeout(self):
+        r = self.get('/stall', timeout=(0.1, 0.2), stream=True)
+        chunks = r.iter_content(1024)
+        self.assertTrue(chunks.next())
+        self.assertRaises(ezid.RequestTimeoutError, list, chunks)
+        r.close()
+        self.assertEqual(self.get('/after').content, 'hello /after')
+        return
+
+    def test_timeout(self):
+        # the slow stream times out; others on the connection carry on
+        slow = []
+        def get_slow():
+            try:
+                self.get('/slow', timeout=(0.1, 0.2))
+            except ezid.RequestTimeoutError as exc:
+                slow.append(exc)
+        t = threading.Thread(target=get_slow)
+        t0 = time.time()
+        t.start()
+        self.assertEqual(self.get('/fast').content, 'hello /fast')
+        t.join()
+        self.assertEqual(len(slow), 1)
+        self.assertTrue(time.time() - t0 < 0.9)
+        self.assertEqual(self.get('/after').content, 'hello /after')
+        self.assertEqual(self.server.n_connections, 1)
+        return
+
+    def test_compression(self):
+        r = self.get('/gzip')
+        self.assertEqual(r.headers['content-encoding'], 'gzip')
+        self.assertEqual(r.content, big_body)
+        accept = self.server.request_headers[-1]['accept-encoding']
+        self.assertEqual(accept, 'gzip, deflate')
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof
@@ -0,0 +1,105 @@
+import unittest
+import logging
+import ezid
+from ezid import sync
+from support import LocalEZIDTestCase, auth, metadata
+
+class UpdateTestCase(LocalEZIDTestCase):
+
+    def setUp(self):
+        LocalEZIDTestCase.setUp(self)
+        self.identifier = ezid.mint('http://example.org/a',
+                                    metadata,
+                                    ezid.test_prefix,
+                                    auth)
+        self.notified = []
+        ezid.observers.append(lambda *args: self.notified.append(args))
+        return
+
+    def test_landing_page_only(self):
+        ezid.update(self.identifier, auth, landing_page='http://example.org/b')
+        doi = ezid.DOI(self.identifier)
+        self.assertEqual(doi.landing_page, 'http://example.org/b')
+        # observers get the full record, with the metadata read back
+        (identifier, landing_page, md) = self.notified[-1]
+        self.assertEqual(identifier, self.identifier)
+        self.assertEqual(landing_page, 'http://example.org/b')
+        self.assertEqual(md, doi.copy_metadata())
+        return
+
+    def test_metadata_only(self):
+        md = dict(metadata, title='New title')
+        ezid.update(self.identifier, auth, metadata=md)
+        (identifier, landing_page, md2) = self.notified[-1]
+        self.assertEqual(landing_page, 'http://example.org/a')
+        self.assertEqual(md2['title'], 'New title')
+        self.assertEqual(ezid.DOI(self.identifier).metadata['title'],
+                         'New title')
+        return
+
+    def test_record_given(self):
+        n_gets = self.handler.counts.get('GET', 0)
+        md = ezid.validate_metadata(metadata)
+        ezid.update(self.identifier,
+                    auth,
+                    landing_page='http://example.org/b',
+                    record=('http://example.org/b', md))
+        self.assertEqual(self.handler.counts.get('GET', 0), n_gets)
+        self.assertEqual(self.notified[-1],
+                         (self.identifier, 'http://example.org/b', md))
+        return
+
+    def test_no_observers_no_read_back(self):
+        ezid.observers = []
+        n_gets = self.handler.counts.get('GET', 0)
+        ezid.update(self.identifier, auth, landing_page='http://example.org/b')
+        self.assertEqual(self.handler.counts.get('GET', 0), n_gets)
+        return
+
+    def test_failing_observer(self):
+        def fail(*args):
+            raise RuntimeError('observer failed')
+        ezid.observers.insert(0, fail)
+        logged = []
+        handler = logging.Handler()
+        handler.emit = logged.append
+        ezid.logger.addHandler(handler)
+        try:
+            # the mint and the update are made and reported
+            identifier = ezid.mint('http://example.org/b',
+                                   metadata,
+                                   ezid.test_prefix,
+                                   auth)
+            ezid.update(identifier, auth, landing_page='http://example.org/c')
+        finally:
+            ezid.logger.removeHandler(handler)
+        self.assertEqual(ezid.DOI(identifier).landing_page,
+                         'http://example.org/c')
+        # later observers still run
+        self.assertEqual([ args[:2] for args in self.notified[-2:] ],
+                         [(identifier, 'http://example.org/b'),
+                          (identifier, 'http://example.org/c')])
+        self.assertEqual(len(logged), 2)
+        self.assertEqual(logged[0].exc_info[0], RuntimeError)
+        return
+
+    def test_sync_notifies(self):
+        state = sync.StateCache(':memory:')
+        state.put(self.identifier,
+                  'http://example.org/a',
+                  ezid.validate_metadata(metadata))
+        entries = [(self.identifier, 'http://example.org/c', metadata)]
+        actions = list(sync.plan(entries, state))
+        self.assertEqual(actions[0].kind, sync.UPDATE_TARGET)
+        counts = sync.sync(actions, auth, state)
+        self.assertEqual(counts, {sync.UPDATE_TARGET: 1})
+        (identifier, landing_page, md) = self.notified[-1]
+        self.assertEqual((identifier, landing_page),
+                         (self.identifier, 'http://example.org/c'))
+        self.assertEqual(md, ezid.validate_metadata(metadata))
+        return
+
+if __name__ == '__main__':
+    unittest.main()
+
+# eof